@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+历史K线回补
+对代码列表的每个周期分页调用 request_history_kline，写入本地 HistoryStore（见 history_store）
+已有数据的代码从倒数第二根K线所在日期重新拉取（最后一根可能是盘中写入的未收盘K线），中断后重新运行即可接着补；
+重叠部分中已收盘K线的前复权价格与本地不一致时（期间有除权除息）该代码整段重新回补
+
+用法: python backfill_history.py [开始日期，默认 fetch_config.HISTORY_START]
+"""
+
+import logging
+import sys
+import time
+from datetime import datetime
+
+try:
+    from moomoo import OpenQuoteContext, AuType, RET_OK
+except ImportError:
+    from futu import OpenQuoteContext, AuType, RET_OK
+
+import fetch_config
+from bar_cache import prices_match
+from fetch_engine import FetchEngine
+from history_store import HistoryStore
+from kline_daemon import normalize_kline
+from opend_replay import open_quote_context
+from universe import UniverseRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_code(quote_ctx: OpenQuoteContext, engine: FetchEngine, store: HistoryStore,
+                  tf: dict, code: str, start: str, end: str) -> int:
+    """
+    回补一个代码一个周期的历史K线，每拉到一页就写入本地
+
+    本地已有数据时只从倒数第二根K线的日期开始回补；第一页与本地重叠、早于本地最后一根的K线价格不一致时
+    （前复权因子变了，本地的整段历史都已过期），删除该代码本地的历史从 start 重新回补。
+    本地最后一根K线可能是收盘前写入的（盘中运行时的日K、周中的周K），与收盘后的价格不同属正常，不参与比较
+
+    Args:
+        quote_ctx: 行情连接
+        engine: 请求引擎（限频、重试）
+        store: 本地存储
+        tf: 周期配置
+        code: 代码
+        start: 开始日期 'YYYY-MM-DD'
+        end: 结束日期 'YYYY-MM-DD'
+
+    Returns:
+        int: 写入的K线根数
+    """
+    first_start = start
+    recent = store.load_tail(tf['name'], code, 2)
+    last = None if recent.empty else recent['DateTime'].iloc[-1]
+    if last is not None:
+        # 从倒数第二根开始，第一页至少与本地有一根已收盘的K线可以比较
+        start = recent['DateTime'].iloc[0].strftime('%Y-%m-%d')
+
+    page_req_key = None
+    total = 0
+    while True:
+        def request_page(c):
+            ret, data, next_key = quote_ctx.request_history_kline(
+                c, start=start, end=end, ktype=tf['ktype'], autype=AuType.QFQ,
+                max_count=fetch_config.HISTORY_PAGE_SIZE, page_req_key=page_req_key)
+            return ret, ((data, next_key) if ret == RET_OK else data)
+
+        ok, payload = engine.request(request_page, code)
+        if not ok:
+            raise RuntimeError(f"request_history_kline 失败: {payload}")
+
+        data, page_req_key = payload
+        bars = normalize_kline(data)
+        if last is not None and total == 0:
+            stored = store.load_tail(tf['name'], code, len(bars))
+            if not prices_match(stored[stored['DateTime'] < last], bars):
+                logger.warning(f"{tf['name']} {code} 本地历史与 OpenD 的前复权价格不一致，删除后重新回补")
+                store.drop_code(tf['name'], code)
+                return backfill_code(quote_ctx, engine, store, tf, code, first_start, end)
+        store.write_bars(tf['name'], code, bars)
+        total += len(bars)
+
+        if page_req_key is None:
+            return total
+
+
+def main():
+    """主函数"""
+    start = sys.argv[1] if len(sys.argv) > 1 else fetch_config.HISTORY_START
+    end = datetime.now().strftime('%Y-%m-%d')
+    codelist = UniverseRegistry.from_config().codes()
+
+    store = HistoryStore(fetch_config.HISTORY_DIR)
+    # 逐页顺序请求，限频由令牌桶控制
+    engine = FetchEngine(workers=1,
+                         rate=fetch_config.HISTORY_RATE,
+                         burst=1,
+                         max_retries=fetch_config.FETCH_MAX_RETRIES,
+                         backoff_base=fetch_config.FETCH_BACKOFF,
+                         breaker_threshold=fetch_config.BREAKER_THRESHOLD,
+                         breaker_cooldown=fetch_config.BREAKER_COOLDOWN)
+    quote_ctx = open_quote_context(fetch_config.OPEND_HOST, fetch_config.OPEND_PORT)
+
+    start_time = time.time()
+    failed = []
+    try:
+        for tf in fetch_config.TIMEFRAMES:
+            for code in codelist:
+                try:
+                    count = backfill_code(quote_ctx, engine, store, tf, code, start, end)
+                    logger.info(f"{tf['name']} {code}: 写入 {count} 根")
+                except Exception as e:
+                    logger.error(f"{tf['name']} {code} 回补失败: {e}")
+                    failed.append((tf['name'], code))
+    finally:
+        quote_ctx.close()
+        engine.shutdown()
+
+    logger.info(f"回补完成，耗时 {time.time() - start_time:.1f} 秒，失败 {len(failed)} 个: {failed}")
+
+
+if __name__ == "__main__":
+    main()
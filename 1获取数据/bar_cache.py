@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+内存K线缓存
+保存每个代码每个周期的K线序列（定长环形缓冲区，见 bar_ring），首次完整抓取后只需合并最近几根K线
+"""
+
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bar_ring import BarRing, frame_to_arrays
+
+# 判断复权变化时比较的列和相对容差；前复权下除权除息会按比例改写全部历史价格，远大于这个误差
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+ADJUST_RTOL = 1e-6
+
+
+def fingerprint(arrays: Dict[str, np.ndarray]) -> bytes:
+    """
+    K线序列的指纹，内容完全相同的序列指纹相同，用于跳过没有变化的写入
+
+    Args:
+        arrays: 按列的数组（见 BarRing.view）
+
+    Returns:
+        bytes: 16 字节摘要
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for arr in arrays.values():
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.digest()
+
+
+def has_gap(last_time: Optional[pd.Timestamp], tail: pd.DataFrame) -> bool:
+    """
+    判断尾部K线与已有序列之间是否有缺口
+
+    尾部第一根K线比缓存最后一根还新，说明两次抓取之间收盘的K线比尾部根数多，
+    中间漏掉的K线只能通过完整重抓补回
+
+    Args:
+        last_time: 已有序列最后一根K线的时间，序列为空时为 None
+        tail: 新抓取的尾部K线，按 DateTime 升序
+
+    Returns:
+        bool: 是否有缺口
+    """
+    if tail.empty:
+        return False
+    return last_time is None or tail['DateTime'].iloc[0] > last_time
+
+
+def prices_match(old: pd.DataFrame, new: pd.DataFrame, rtol: float = ADJUST_RTOL) -> bool:
+    """
+    比较两段K线在共同时间上的开高低收，用于发现复权因子变化（前复权的历史价格被整体改写）
+
+    Args:
+        old: 已保存的K线
+        new: 新抓取的K线
+        rtol: 相对容差
+
+    Returns:
+        bool: 共同时间上的价格全部一致（没有共同时间时也为 True）
+    """
+    merged = old[['DateTime'] + PRICE_COLUMNS].merge(new[['DateTime'] + PRICE_COLUMNS], on='DateTime')
+    return bool(np.allclose(merged[[f'{c}_x' for c in PRICE_COLUMNS]].to_numpy(dtype='float64'),
+                            merged[[f'{c}_y' for c in PRICE_COLUMNS]].to_numpy(dtype='float64'),
+                            rtol=rtol, atol=0))
+
+
+class KlineSeriesStore:
+    """
+    按 (K线类型, 代码) 保存内存中的K线序列，推送线程与主线程共享
+
+    每个序列是一个容量固定的 BarRing，合并只改写数组；数据框只在 get、window 需要时组装（只组装要用的最近几根）
+    """
+
+    def __init__(self):
+        self._rings: Dict[Tuple[str, str], BarRing] = {}
+        # 每个序列中已由 OpenD 确认收盘的最后一根K线时间（纳秒）：一批 OpenD 的K线中除最后一根外都已收盘；
+        # 由快照、成交合成或由源周期合成的K线不算，见 closed_bars_match
+        self._confirmed: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _confirm(self, key: Tuple[str, str], times: np.ndarray):
+        """记下 OpenD 的一批K线中已收盘的最后一根（调用方持有锁）"""
+        if len(times) >= 2:
+            self._confirmed[key] = max(self._confirmed.get(key, times[-2]), times[-2])
+
+    def seed(self, ktype: str, code: str, data: pd.DataFrame, capacity: Optional[int] = None):
+        """
+        用一次完整抓取的结果初始化序列
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            data: 完整抓取的K线（已整理列名）
+            capacity: 序列最多保留的K线根数，默认为 data 的根数
+        """
+        ring = BarRing(capacity or len(data))
+        values = frame_to_arrays(data)
+        ring.append(values)
+        with self._lock:
+            self._rings[(ktype, code)] = ring
+            self._confirmed.pop((ktype, code), None)
+            self._confirm((ktype, code), values['DateTime'])
+
+    def has(self, ktype: str, code: str) -> bool:
+        """是否已有该代码的序列"""
+        with self._lock:
+            return (ktype, code) in self._rings
+
+    def last_time(self, ktype: str, code: str) -> Optional[pd.Timestamp]:
+        """序列最后一根K线的时间，没有序列或序列为空时返回 None"""
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            return None if ring is None else ring.last_time()
+
+    def get(self, ktype: str, code: str, n: Optional[int] = None,
+            since: Optional[pd.Timestamp] = None) -> Optional[pd.DataFrame]:
+        """
+        组装某代码的序列
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            n: 只取最近 n 根，None 为全部
+            since: 只取时间不早于 since 的K线，None 为不限
+
+        Returns:
+            pandas.DataFrame: 按时间升序的K线，序列不存在时返回 None
+        """
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            if ring is None:
+                return None
+            if since is not None:
+                times = ring.view(n)['DateTime']
+                n = len(times) - int(np.searchsorted(times, pd.Timestamp(since).value))
+            return ring.to_frame(n)
+
+    def window(self, ktype: str, code: str, n: int,
+               previous: Optional[bytes] = None) -> Optional[Tuple[bytes, Optional[pd.DataFrame]]]:
+        """
+        最近 n 根K线的指纹，指纹与 previous 不同时才组装数据框（内容没变的写入不产生数据框）
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            n: K线根数
+            previous: 上次写入的指纹
+
+        Returns:
+            tuple: (指纹, 数据框；指纹没变时为 None)，序列不存在时返回 None
+        """
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            if ring is None:
+                return None
+            digest = fingerprint(ring.view(n))
+            return digest, (None if digest == previous else ring.to_frame(n))
+
+    def view(self, ktype: str, code: str, n: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """某代码最近 n 根K线的只读数组视图（不复制），不存在时返回 None"""
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            return None if ring is None else ring.view(n)
+
+    def apply(self, ktype: str, code: str, bars: pd.DataFrame, max_bars: int, confirm: bool = True):
+        """
+        合并推送的K线：同一时间的K线被替换（未收盘K线不断更新），更新的时间追加在末尾
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            bars: 推送的K线（已整理列名）
+            max_bars: 序列最多保留的K线根数（新建序列时的容量）
+            confirm: bars 来自 OpenD（最后一根之前的都已收盘）；快照、本地合成的K线为 False
+        """
+        values = frame_to_arrays(bars.drop_duplicates(subset='DateTime', keep='last'))
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            if ring is None:
+                ring = self._rings[(ktype, code)] = BarRing(max_bars)
+            ring.upsert(values)
+            if confirm:
+                self._confirm((ktype, code), values['DateTime'])
+
+    def merge_forming(self, ktype: str, code: str, bars: pd.DataFrame) -> Optional[pd.Timestamp]:
+        """
+        把由成交合成的K线并入序列：与最后一根同一时间的合并高低价、收盘价并累加成交量，
+        更新的时间追加在末尾，更早的（已收盘、以 OpenD 为准）丢弃
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            bars: 由成交合成的K线，按时间升序
+
+        Returns:
+            pandas.Timestamp: 最早变化的K线时间；没有序列或没有变化时返回 None
+        """
+        values = frame_to_arrays(bars)
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            if ring is None or ring.size == 0:
+                return None
+            last = {name: arr[-1] for name, arr in ring.view(1).items()}
+            keep = values['DateTime'] >= last['DateTime']
+            if not keep.any():
+                return None
+            values = {name: arr[keep] for name, arr in values.items()}
+            if values['DateTime'][0] == last['DateTime']:
+                values['Open'][0] = last['Open']
+                values['High'][0] = max(values['High'][0], last['High'])
+                values['Low'][0] = min(values['Low'][0], last['Low'])
+                values['Volume'][0] += last['Volume']
+            ring.upsert(values)
+            return pd.Timestamp(int(values['DateTime'][0]))
+
+    def closed_bars_match(self, ktype: str, code: str, bars: pd.DataFrame, rtol: float = ADJUST_RTOL) -> bool:
+        """
+        新抓取的尾部K线中已收盘的K线，与缓存中写入时就已由 OpenD 确认收盘的K线比较价格；
+        不一致说明复权因子变了，缓存的整段历史都需要重建。写入时还未收盘的K线（包括快照、成交推送
+        合并出的K线）可能与 OpenD 最终的K线不同，不参与比较
+
+        Args:
+            ktype: K线类型
+            code: 代码
+            bars: 新抓取的K线（已整理列名）
+            rtol: 相对容差
+
+        Returns:
+            bool: 一致，或没有可比较的K线
+        """
+        values = frame_to_arrays(bars)
+        with self._lock:
+            ring = self._rings.get((ktype, code))
+            confirmed = self._confirmed.get((ktype, code))
+            if ring is None or ring.size == 0 or confirmed is None or len(values['DateTime']) < 2:
+                return True
+            current = ring.view()
+            times = current['DateTime']
+            closed = (values['DateTime'] <= confirmed) & (values['DateTime'] < values['DateTime'][-1])
+            index = np.searchsorted(times, values['DateTime'][closed])
+            hit = times[index] == values['DateTime'][closed]
+            return all(np.allclose(current[name][index[hit]], values[name][closed][hit], rtol=rtol, atol=0)
+                       for name in PRICE_COLUMNS)
+
+    def memory_bytes(self) -> int:
+        """全部序列占用的内存字节数"""
+        with self._lock:
+            return sum(ring.nbytes for ring in self._rings.values())
+
+    def drop(self, code: str, ktypes: Optional[List[str]] = None):
+        """删除某代码的序列（代码移出代码池时），ktypes 为 None 时删除所有周期"""
+        with self._lock:
+            for key in [key for key in self._rings if key[1] == code and (ktypes is None or key[0] in ktypes)]:
+                del self._rings[key]
+                self._confirmed.pop(key, None)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+K线数据框的 Redis 序列化格式
+'npy': 按列打包的 NumPy 二进制，前面带一个小的头部，读取时直接按列映射为数组，不需要解析文本
+'csv': 原来的 CSV 文本，作为兼容和回退格式
+读取端根据头部的魔数自动识别格式，新旧两种数据可以同时存在
+
+两种格式都可以再用 LZ4 或 zstd 压缩（可选依赖 lz4、zstandard），头部的标志字节记录压缩方式，
+压缩的 csv 也带头部；不压缩的 csv 仍是原来的纯文本。zstd 可以使用按K线数据训练的字典（见 train_zstd_dictionary），
+写入端和读取端加载同一个字典文件（load_zstd_dictionary，或设置环境变量 BAR_CODEC_ZSTD_DICT）
+编码、解码的字节数和 CPU 时间累计在 codec_stats() 中，用于选择压缩方式和级别
+
+用法: python bar_codec.py bench <Redis地址> [键模式，默认 BY54_*]
+    读取一批键，打印各压缩方式和级别的压缩比、每个值的编码/解码 CPU 时间
+      python bar_codec.py train <Redis地址> <字典文件> [键模式，默认 BY54_*] [字典字节数，默认 16384]
+    用这批键训练 zstd 字典
+
+2计算技术指标/bar_codec.py 由 1获取数据/sync_copies.py 从本文件生成，修改本文件后运行 python sync_copies.py
+"""
+
+import io
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 二进制格式魔数
+MAGIC = b'BY54'
+
+# 头部：魔数(4) + 版本(1) + 格式(1) + 标志(1) + 保留(1) + JSON 描述长度(4)
+# 压缩时头部之后的全部内容（npy 为 JSON 描述和数组，csv 为文本）整体压缩，描述长度仍为压缩前的长度
+HEADER = struct.Struct('<4sBBBBI')
+VERSION = 1
+
+CODEC_CSV = 'csv'
+CODEC_NPY = 'npy'
+CODEC_IDS = {CODEC_NPY: 1, CODEC_CSV: 2}
+
+# 标志位：压缩方式，以及 zstd 是否使用了字典
+FLAG_LZ4 = 0x01
+FLAG_ZSTD = 0x02
+FLAG_DICT = 0x04
+COMPRESSIONS = {'lz4': FLAG_LZ4, 'zstd': FLAG_ZSTD}
+
+# K线数据框的列顺序，以及除 DateTime（int64 纳秒）外各列的数组类型；
+# 抓取服务写入 Redis、共享内存和内存缓存的K线都按这个列顺序
+BAR_COLUMNS = ['DateTime', 'Close', 'High', 'Low', 'Open', 'Volume']
+BAR_VALUE_DTYPES = {
+    'Close': np.float64,
+    'High': np.float64,
+    'Low': np.float64,
+    'Open': np.float64,
+    'Volume': np.int64,
+}
+
+# 设置后导入时自动加载的 zstd 字典文件
+ZSTD_DICT_ENV = 'BAR_CODEC_ZSTD_DICT'
+
+# 字典 ID -> 字典；编码使用最后加载的字典
+_zstd_dicts: Dict[int, object] = {}
+_zstd_dict = None
+# zstd 压缩/解压对象不能多线程共用，每个线程各自缓存
+_local = threading.local()
+
+
+class _CodecStats:
+    """编码、解码的累计次数、字节数和 CPU 时间（各线程合计）"""
+
+    FIELDS = ('encodes', 'raw_bytes', 'encoded_bytes', 'encode_cpu', 'decodes', 'decoded_bytes', 'decode_cpu')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.values = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.values[name] += value
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            stats = dict(self.values)
+        stats['ratio'] = round(stats['raw_bytes'] / stats['encoded_bytes'], 2) if stats['encoded_bytes'] else None
+        stats['encode_cpu'] = round(stats['encode_cpu'], 4)
+        stats['decode_cpu'] = round(stats['decode_cpu'], 4)
+        return stats
+
+
+_stats = _CodecStats()
+
+
+def codec_stats(reset: bool = False) -> Dict[str, float]:
+    """
+    本进程累计的编码、解码统计
+
+    Args:
+        reset: 取出后清零
+
+    Returns:
+        Dict: encodes/decodes 次数，raw_bytes 压缩前字节数，encoded_bytes 写入 Redis 的字节数，
+              decoded_bytes 从 Redis 读取的字节数，encode_cpu/decode_cpu CPU 秒数，ratio 压缩比
+    """
+    stats = _stats.snapshot()
+    if reset:
+        _stats.reset()
+    return stats
+
+
+def load_zstd_dictionary(path: str):
+    """加载 zstd 字典文件，之后的 zstd 编码使用它，解码时按数据中的字典 ID 查找"""
+    global _zstd_dict
+    if zstandard is None:
+        raise ImportError("使用 zstd 字典需要安装 zstandard")
+    with open(path, 'rb') as f:
+        d = zstandard.ZstdCompressionDict(f.read())
+    _zstd_dicts[d.dict_id()] = d
+    _zstd_dict = d
+
+
+def train_zstd_dictionary(payloads: List[bytes], dict_size: int = 16384) -> bytes:
+    """
+    用一批 Redis 值（未压缩）训练 zstd 字典
+
+    Args:
+        payloads: encode_frame(..., compression=None) 的结果或原来的 CSV 文本
+        dict_size: 字典字节数
+
+    Returns:
+        bytes: 字典内容，保存为文件后用 load_zstd_dictionary 加载
+    """
+    if zstandard is None:
+        raise ImportError("训练 zstd 字典需要安装 zstandard")
+    samples = [p.encode('utf-8') if isinstance(p, str) else bytes(p) for p in payloads]
+    return zstandard.train_dictionary(dict_size, samples).as_bytes()
+
+
+def _compress(body: bytes, compression: str, level: Optional[int]) -> Tuple[bytes, int]:
+    """压缩头部之后的内容，返回 (压缩后的内容, 标志)"""
+    if compression == 'lz4':
+        if lz4_frame is None:
+            raise ImportError("lz4 压缩需要安装 lz4")
+        return lz4_frame.compress(body, compression_level=level or 0), FLAG_LZ4
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstd 压缩需要安装 zstandard")
+        key = ('c', level, None if _zstd_dict is None else _zstd_dict.dict_id())
+        compressor = _local.__dict__.get(key)
+        if compressor is None:
+            compressor = _local.__dict__[key] = zstandard.ZstdCompressor(level=3 if level is None else level,
+                                                                          dict_data=_zstd_dict)
+        return compressor.compress(body), FLAG_ZSTD | (FLAG_DICT if _zstd_dict is not None else 0)
+    raise ValueError(f"未知的压缩方式: {compression}")
+
+
+def _decompress(body: memoryview, flags: int) -> bytes:
+    if flags & FLAG_LZ4:
+        if lz4_frame is None:
+            raise ImportError("读取 lz4 压缩的数据需要安装 lz4")
+        return lz4_frame.decompress(body)
+    if flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ImportError("读取 zstd 压缩的数据需要安装 zstandard")
+        dict_id = zstandard.get_frame_parameters(body).dict_id if flags & FLAG_DICT else 0
+        if dict_id and dict_id not in _zstd_dicts:
+            raise ValueError(f"数据使用了 zstd 字典 {dict_id}，需要先 load_zstd_dictionary 加载同一个字典")
+        key = ('d', dict_id)
+        decompressor = _local.__dict__.get(key)
+        if decompressor is None:
+            decompressor = _local.__dict__[key] = zstandard.ZstdDecompressor(dict_data=_zstd_dicts.get(dict_id))
+        return decompressor.decompress(body)
+    return bytes(body)
+
+
+def _npy_body(df: pd.DataFrame) -> Tuple[bytes, int]:
+    """npy 格式头部之后的内容（JSON 描述 + 按列的数组），返回 (内容, 描述长度)"""
+    columns = []
+    buffers = []
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            kind = 'datetime'
+            arr = col.to_numpy(dtype='datetime64[ns]').view('int64')
+        elif pd.api.types.is_numeric_dtype(col) or pd.api.types.is_bool_dtype(col):
+            kind = 'num'
+            arr = col.to_numpy()
+        else:
+            kind = 'str'
+            arr = col.astype(str).to_numpy(dtype=str)
+        arr = np.ascontiguousarray(arr)
+        columns.append({'name': str(name), 'kind': kind, 'dtype': arr.dtype.str, 'nbytes': arr.nbytes})
+        buffers.append(arr.tobytes())
+
+    meta = json.dumps({'rows': len(df), 'columns': columns}, ensure_ascii=False).encode('utf-8')
+    return meta + b''.join(buffers), len(meta)
+
+
+def encode_frame(df: pd.DataFrame, codec: str = CODEC_CSV, compression: Optional[str] = None,
+                 level: Optional[int] = None) -> Union[str, bytes]:
+    """
+    数据框序列化为 Redis 值
+
+    Args:
+        df: 数据框
+        codec: 'npy' 或 'csv'
+        compression: None 不压缩，'lz4' 或 'zstd'
+        level: 压缩级别，None 为默认级别
+
+    Returns:
+        str 或 bytes: 不压缩的 csv 返回文本，其余返回带头部的二进制
+    """
+    start = time.thread_time()
+    if codec == CODEC_CSV:
+        text = df.to_csv(index=False)
+        if compression is None:
+            size = len(text)
+            _stats.add(encodes=1, raw_bytes=size, encoded_bytes=size, encode_cpu=time.thread_time() - start)
+            return text
+        body, meta_len = text.encode('utf-8'), 0
+    elif codec == CODEC_NPY:
+        body, meta_len = _npy_body(df)
+    else:
+        raise ValueError(f"未知的序列化格式: {codec}")
+
+    raw_size = HEADER.size + len(body)
+    flags = 0
+    if compression is not None:
+        body, flags = _compress(body, compression, level)
+    payload = HEADER.pack(MAGIC, VERSION, CODEC_IDS[codec], flags, 0, meta_len) + body
+    _stats.add(encodes=1, raw_bytes=raw_size, encoded_bytes=len(payload), encode_cpu=time.thread_time() - start)
+    return payload
+
+
+def is_binary(payload: Union[str, bytes]) -> bool:
+    """判断 Redis 值是否为带头部的二进制格式"""
+    return isinstance(payload, (bytes, bytearray, memoryview)) and bytes(payload[:4]) == MAGIC
+
+
+def _unpack(payload: bytes) -> Tuple[int, int, memoryview]:
+    """解析头部并解压，返回 (格式 ID, 描述长度, 头部之后的内容)"""
+    view = memoryview(payload)
+    magic, version, codec_id, flags, _, meta_len = HEADER.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION or codec_id not in CODEC_IDS.values():
+        raise ValueError(f"无法识别的二进制格式: version={version}, codec={codec_id}")
+    body = view[HEADER.size:]
+    if flags & (FLAG_LZ4 | FLAG_ZSTD):
+        body = memoryview(_decompress(body, flags))
+    return codec_id, meta_len, body
+
+
+def decode_arrays(payload: bytes) -> Dict[str, np.ndarray]:
+    """
+    二进制值映射为按列的数组（不压缩时为只读视图，不复制数据）
+
+    Args:
+        payload: encode_frame(..., 'npy') 的结果
+
+    Returns:
+        Dict[str, np.ndarray]: 列名 -> 数组，时间列为 datetime64[ns]
+    """
+    codec_id, meta_len, view = _unpack(payload)
+    if codec_id != CODEC_IDS[CODEC_NPY]:
+        raise ValueError(f"不是 npy 格式: codec={codec_id}")
+    return _npy_arrays(view, meta_len)
+
+
+def _npy_arrays(view: memoryview, meta_len: int) -> Dict[str, np.ndarray]:
+    """npy 格式头部之后的内容映射为数组"""
+    meta = json.loads(bytes(view[:meta_len]).decode('utf-8'))
+    offset = meta_len
+
+    arrays = {}
+    for col in meta['columns']:
+        arr = np.frombuffer(view[offset:offset + col['nbytes']], dtype=np.dtype(col['dtype']))
+        if col['kind'] == 'datetime':
+            arr = arr.view('datetime64[ns]')
+        arrays[col['name']] = arr
+        offset += col['nbytes']
+    return arrays
+
+
+def decode_frame(payload: Union[str, bytes]) -> pd.DataFrame:
+    """
+    Redis 值还原为数据框，自动识别 npy 和 csv 两种格式
+
+    Args:
+        payload: Redis GET 的结果（bytes 或 str）
+
+    Returns:
+        pandas.DataFrame: 数据框
+    """
+    start = time.thread_time()
+    if is_binary(payload):
+        codec_id, meta_len, body = _unpack(payload)
+        if codec_id == CODEC_IDS[CODEC_NPY]:
+            df = pd.DataFrame(_npy_arrays(body, meta_len))
+        else:
+            df = pd.read_csv(io.StringIO(bytes(body).decode('utf-8')))
+    else:
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode('utf-8')
+        df = pd.read_csv(io.StringIO(payload))
+    _stats.add(decodes=1, decoded_bytes=len(payload), decode_cpu=time.thread_time() - start)
+    return df
+
+
+def _read_payloads(host: str, pattern: str) -> List[bytes]:
+    import redis
+
+    r = redis.Redis(host=host, port=6379, db=0)
+    keys = [key for key in r.scan_iter(match=pattern, count=1000) if r.type(key) == b'string']
+    return [p for p in r.mget(keys) if p] if keys else []
+
+
+def main(argv: List[str]):
+    """bench：比较压缩方式和级别；train：训练 zstd 字典"""
+    if len(argv) < 2 or argv[0] not in ('bench', 'train') or (argv[0] == 'train' and len(argv) < 3):
+        print(__doc__)
+        return
+
+    if argv[0] == 'train':
+        pattern = argv[3] if len(argv) > 3 else 'BY54_*'
+        frames = [decode_frame(p) for p in _read_payloads(argv[1], pattern)]
+        samples = [encode_frame(df, CODEC_NPY) for df in frames] + [encode_frame(df, CODEC_CSV) for df in frames]
+        data = train_zstd_dictionary(samples, int(argv[4]) if len(argv) > 4 else 16384)
+        with open(argv[2], 'wb') as f:
+            f.write(data)
+        print(f"用 {len(frames)} 个键训练字典 {len(data)} 字节，已保存到 {argv[2]}")
+        return
+
+    frames = [decode_frame(p) for p in _read_payloads(argv[1], argv[2] if len(argv) > 2 else 'BY54_*')]
+    if not frames:
+        print("没有读取到数据")
+        return
+    options = [(None, None)] + [('lz4', level) for level in (0, 3, 9)] + [('zstd', level) for level in (1, 3, 9)]
+    print(f"{len(frames)} 个键")
+    for codec in (CODEC_CSV, CODEC_NPY):
+        for compression, level in options:
+            if (compression == 'lz4' and lz4_frame is None) or (compression == 'zstd' and zstandard is None):
+                continue
+            codec_stats(reset=True)
+            payloads = [encode_frame(df, codec, compression, level) for df in frames]
+            for payload in payloads:
+                decode_frame(payload)
+            s = codec_stats(reset=True)
+            print(f"{codec:>4} {str(compression):>5} {str(level):>4}: {s['encoded_bytes']:>10} 字节 "
+                  f"压缩比 {s['raw_bytes'] / s['encoded_bytes']:.2f}  "
+                  f"编码 {s['encode_cpu'] / len(frames) * 1e6:.0f} 微秒/键  解码 {s['decode_cpu'] / len(frames) * 1e6:.0f} 微秒/键")
+
+
+if os.environ.get(ZSTD_DICT_ENV):
+    load_zstd_dictionary(os.environ[ZSTD_DICT_ENV])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
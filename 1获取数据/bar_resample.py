@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+本地K线合成
+用 1 分钟K线合成 60 分钟、日K，用日K合成周K，按代码所在市场的交易时段（含午休，见 trading_calendar）划分：
+    60 分钟：A股 10:30、11:30、14:00、15:00 四根，港股 10:30、11:30、12:00、14:00、15:00、16:00 六根，
+            K线时间为该小时的结束时间（与 get_cur_kline 一致）
+    日K：    当天 00:00:00
+    周K：    该周第一个交易日 00:00:00
+
+源序列最前面的一个周期可能不完整（窗口从周期中间开始），合成结果总是丢弃它，
+因此源序列必须覆盖到要更新的整个周期（1 分钟缓存至少一整天，日K缓存至少一整周）
+
+直接运行本文件会从 OpenD 抓取同一窗口的 1 分钟K线和 60 分钟/日/周K线，逐根比对合成结果
+"""
+
+import logging
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from bar_codec import BAR_COLUMNS
+from trading_calendar import CALENDARS, DEFAULT_MARKETS, market_of, minute_of_day
+
+logger = logging.getLogger(__name__)
+
+
+def hour_labels(dt: pd.Series, market: str = DEFAULT_MARKETS[0]) -> pd.Series:
+    """每根 1 分钟K线所属 60 分钟K线的时间（该小时的结束时间），market 为代码所在市场"""
+    hour_ends = np.array([minute_of_day(t) for t in CALENDARS[market].hour_bar_ends])
+    minutes = (dt.dt.hour * 60 + dt.dt.minute).to_numpy()
+    # 归入第一个不早于它的小时结束时间：09:30 集合竞价那一根并入 10:30，13:00 之后到 14:00 并入 14:00
+    ends = hour_ends[np.minimum(np.searchsorted(hour_ends, minutes), len(hour_ends) - 1)]
+    return dt.dt.normalize() + pd.to_timedelta(ends, unit='min')
+
+
+def _week_labels(dt: pd.Series) -> pd.Series:
+    """每根日K所属周K的时间（该周第一个交易日）"""
+    dates = dt.dt.normalize()
+    monday = dates - pd.to_timedelta(dates.dt.weekday, unit='D')
+    return dates.groupby(monday).transform('min')
+
+
+def resample_bars(source: pd.DataFrame, ktype: str, market: str = DEFAULT_MARKETS[0]) -> pd.DataFrame:
+    """
+    合成更高周期的K线
+
+    Args:
+        source: 源序列，按 DateTime 升序；K_60M、K_DAY 用 1 分钟K线，K_WEEK 用日K
+        ktype: 目标周期 'K_60M'、'K_DAY' 或 'K_WEEK'
+        market: 代码所在市场（决定 60 分钟K线的划分）
+
+    Returns:
+        pandas.DataFrame: 合成的K线，已丢弃最前面可能不完整的一个周期
+    """
+    if source.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    dt = source['DateTime']
+    if ktype == 'K_60M':
+        labels = hour_labels(dt, market)
+    elif ktype == 'K_DAY':
+        labels = dt.dt.normalize()
+    elif ktype == 'K_WEEK':
+        labels = _week_labels(dt)
+    else:
+        raise ValueError(f"不支持合成的K线类型: {ktype}")
+
+    bars = source.groupby(labels.rename('DateTime'), sort=True).agg(
+        Close=('Close', 'last'),
+        High=('High', 'max'),
+        Low=('Low', 'min'),
+        Open=('Open', 'first'),
+        Volume=('Volume', 'sum'),
+    ).reset_index()
+
+    return bars.iloc[1:][BAR_COLUMNS].reset_index(drop=True)
+
+
+def compare_bars(derived: pd.DataFrame, fetched: pd.DataFrame, rtol: float = 1e-9) -> pd.DataFrame:
+    """
+    逐根比对合成K线与 OpenD 返回的K线（只比较两边都有的时间）
+
+    Args:
+        derived: resample_bars 的结果
+        fetched: get_cur_kline 整理后的同周期K线
+        rtol: 价格相对误差容忍度
+
+    Returns:
+        pandas.DataFrame: 不一致的K线，两边的列分别带 _derived / _fetched 后缀；全部一致时为空
+    """
+    merged = derived.merge(fetched[BAR_COLUMNS], on='DateTime', suffixes=('_derived', '_fetched'))
+    mismatch = np.zeros(len(merged), dtype=bool)
+    for col in ['Close', 'High', 'Low', 'Open']:
+        mismatch |= ~np.isclose(merged[col + '_derived'], merged[col + '_fetched'], rtol=rtol, atol=0)
+    mismatch |= merged['Volume_derived'].to_numpy() != merged['Volume_fetched'].to_numpy()
+    return merged[mismatch]
+
+
+def main(codes: List[str]):
+    """对给定代码比对合成结果与 OpenD 的K线，打印不一致的K线"""
+    try:
+        from moomoo import OpenQuoteContext, AuType, RET_OK
+    except ImportError:
+        from futu import OpenQuoteContext, AuType, RET_OK
+
+    import fetch_config
+    from kline_daemon import normalize_kline
+
+    quote_ctx = OpenQuoteContext(host=fetch_config.OPEND_HOST, port=fetch_config.OPEND_PORT)
+    try:
+        ret_sub, err_message = quote_ctx.subscribe(codes, ['K_1M', 'K_60M', 'K_DAY', 'K_WEEK'],
+                                                   subscribe_push=False)
+        if ret_sub != RET_OK:
+            print(f"订阅失败: {err_message}")
+            return
+
+        def fetch(code, num, ktype):
+            ret, data = quote_ctx.get_cur_kline(code, num, ktype, AuType.QFQ)
+            if ret != RET_OK:
+                raise RuntimeError(f"{code} {ktype} get_cur_kline 失败: {data}")
+            return normalize_kline(data)
+
+        for code in codes:
+            minute = fetch(code, 1000, 'K_1M')
+            daily = fetch(code, 50, 'K_DAY')
+            checks = [('K_60M', resample_bars(minute, 'K_60M', market_of(code)), fetch(code, 50, 'K_60M')),
+                      ('K_DAY', resample_bars(minute, 'K_DAY'), daily),
+                      ('K_WEEK', resample_bars(daily, 'K_WEEK'), fetch(code, 50, 'K_WEEK'))]
+            for ktype, derived, fetched in checks:
+                diff = compare_bars(derived, fetched)
+                matched = len(derived.merge(fetched[['DateTime']], on='DateTime'))
+                print(f"{code} {ktype}: 比对 {matched} 根，不一致 {len(diff)} 根")
+                if not diff.empty:
+                    print(diff)
+    finally:
+        quote_ctx.close()
+
+
+if __name__ == "__main__":
+    from universe import UniverseRegistry
+
+    main(UniverseRegistry.from_config().codes()[:5])
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+定长环形K线缓冲区
+每个代码每个周期一组预分配的 NumPy 数组（时间 int64 纳秒，OHLC float64，成交量 int64），容量固定、内存不随运行时间增长；
+数组长度为容量的两倍，每根K线同时写在 i 和 i + 容量 两个位置，最近 N 根总是一段连续内存，
+取出时直接返回视图不复制；追加、替换最后一根都是 O(1)，只在需要时才组装 pandas 数据框
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from bar_codec import BAR_VALUE_DTYPES
+
+
+def frame_to_arrays(bars: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """数据框转为按列的数组，DateTime 转为 int64 纳秒"""
+    arrays = {'DateTime': bars['DateTime'].to_numpy(dtype='datetime64[ns]').view('int64')}
+    for name, dtype in BAR_VALUE_DTYPES.items():
+        arrays[name] = bars[name].to_numpy(dtype=dtype)
+    return arrays
+
+
+class BarRing:
+    """一个代码一个周期的环形K线缓冲区（非线程安全，由 KlineSeriesStore 加锁）"""
+
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: 最多保留的K线根数
+        """
+        self.capacity = max(capacity, 1)
+        self.arrays = {'DateTime': np.zeros(2 * self.capacity, dtype=np.int64)}
+        for name, dtype in BAR_VALUE_DTYPES.items():
+            self.arrays[name] = np.zeros(2 * self.capacity, dtype=dtype)
+        # 下一根K线写入的位置，以及已有的根数
+        self.head = 0
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        """占用的内存字节数"""
+        return sum(arr.nbytes for arr in self.arrays.values())
+
+    def _write(self, positions: np.ndarray, values: Dict[str, np.ndarray]):
+        for name, arr in self.arrays.items():
+            arr[positions] = values[name]
+            arr[positions + self.capacity] = values[name]
+
+    def _take(self, values: Dict[str, np.ndarray], mask) -> Dict[str, np.ndarray]:
+        return {name: arr[mask] for name, arr in values.items()}
+
+    def append(self, values: Dict[str, np.ndarray]):
+        """
+        在末尾追加K线（时间必须都比最后一根新），超出容量时覆盖最早的K线
+
+        Args:
+            values: 按列的数组，DateTime 为 int64 纳秒
+        """
+        count = len(values['DateTime'])
+        if count > self.capacity:
+            values = self._take(values, slice(-self.capacity, None))
+            count = self.capacity
+        positions = (self.head + np.arange(count)) % self.capacity
+        self._write(positions, values)
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def upsert(self, values: Dict[str, np.ndarray]):
+        """
+        合并K线：同一时间的K线原地替换（未收盘K线不断更新），更新的时间追加在末尾
+
+        更早且缓冲区里没有的时间只能整体重建，正常的尾部合并和推送不会走到这一步
+
+        Args:
+            values: 按列的数组，DateTime 为升序、不重复的 int64 纳秒
+        """
+        times = values['DateTime']
+        if len(times) == 0:
+            return
+        if self.size == 0:
+            self.append(values)
+            return
+
+        current = self.view()['DateTime']
+        old = times <= current[-1]
+        if old.any():
+            index = np.searchsorted(current, times[old])
+            found = index < self.size
+            found[found] = current[index[found]] == times[old][found]
+            if not found.all():
+                self._rebuild(values)
+                return
+            positions = (self.head - self.size + index) % self.capacity
+            self._write(positions, self._take(values, old))
+        if not old.all():
+            self.append(self._take(values, ~old))
+
+    def _rebuild(self, values: Dict[str, np.ndarray]):
+        """按时间合并已有K线和新K线后重新写入"""
+        current = {name: arr.copy() for name, arr in self.view().items()}
+        keep = ~np.isin(current['DateTime'], values['DateTime'])
+        merged = {name: np.concatenate([current[name][keep], values[name]]) for name in current}
+        order = np.argsort(merged['DateTime'], kind='stable')
+        self.head = 0
+        self.size = 0
+        self.append({name: arr[order] for name, arr in merged.items()})
+
+    def view(self, n: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        最近 n 根K线的只读视图（不复制），n 为 None 时返回全部
+
+        Returns:
+            Dict[str, numpy.ndarray]: 按列的数组，按时间升序，DateTime 为 int64 纳秒
+        """
+        n = self.size if n is None else min(n, self.size)
+        end = self.head + self.capacity
+        views = {}
+        for name, arr in self.arrays.items():
+            v = arr[end - n:end]
+            v.flags.writeable = False
+            views[name] = v
+        return views
+
+    def last_time(self) -> Optional[pd.Timestamp]:
+        """最后一根K线的时间，没有K线时返回 None"""
+        if self.size == 0:
+            return None
+        return pd.Timestamp(int(self.arrays['DateTime'][self.head + self.capacity - 1]))
+
+    def to_frame(self, n: Optional[int] = None) -> pd.DataFrame:
+        """组装最近 n 根K线的数据框（列为 bar_codec.BAR_COLUMNS）"""
+        views = self.view(n)
+        data = {'DateTime': views['DateTime'].view('datetime64[ns]')}
+        data.update((name, views[name]) for name in BAR_VALUE_DTYPES)
+        return pd.DataFrame(data)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+常驻K线抓取服务配置
+一个进程同时服务 K_1M / K_60M / K_DAY / K_WEEK，取代原来四个由 .bat 循环重启的抓取脚本
+"""
+
+# OpenD 网关
+OPEND_HOST = '127.0.0.1'
+OPEND_PORT = 11111
+
+# 抓取服务使用的全部 OpenD（见 gateway_pool.py），代码按负载和订阅额度分到各网关，每个网关单独限频，
+# 某个网关断开时它的代码迁到其它网关；例如再加一个 ('127.0.0.1', 11112)
+#   GATEWAY_REBALANCE_SLACK: 各网关代码数相差超过这个数时迁移代码
+OPEND_ENDPOINTS = [(OPEND_HOST, OPEND_PORT)]
+GATEWAY_REBALANCE_SLACK = 8
+
+# OpenD 录制与回放（见 opend_replay.py）
+#   OPEND_RECORD:      录制文件路径，设置后真实 OpenD 的响应和推送同时追加写入该文件
+#   OPEND_REPLAY:      回放文件路径，设置后不连接 OpenD，按录制的响应返回
+#   REPLAY_LATENCY:    回放时每次请求的固定延迟（秒）
+#   REPLAY_JITTER:     在固定延迟上再加 0~REPLAY_JITTER 秒的随机延迟
+#   REPLAY_ERROR_RATE: 回放时每次请求返回注入错误（限频、断线、未知代码）的概率
+#   REPLAY_SEED:       随机数种子，相同种子的延迟和错误序列相同
+#   REPLAY_QUOTA:      回放时模拟的订阅额度
+OPEND_RECORD = None
+OPEND_REPLAY = None
+REPLAY_LATENCY = 0.0
+REPLAY_JITTER = 0.0
+REPLAY_ERROR_RATE = 0.0
+REPLAY_SEED = 0
+REPLAY_QUOTA = 1000
+
+# Redis 服务器
+REDIS_HOST = '127.0.0.1'
+REDIS_PORT = 6379
+REDIS_DB = 0
+
+# 复制写入的其它 Redis（见 redis_writer.RedisFanoutWriter），每个目标一个写线程和队列，
+# 慢或连不上的目标只积压自己的写入（同键合并），不拖慢主 Redis；例如 [('192.168.102.199', 6379, 0)]
+#   REDIS_REPLICAS:       目标列表 [(host, port, db), ...]
+#   REDIS_LAG_WARN:       某个目标落后超过这个秒数时告警
+#   REDIS_STATS_INTERVAL: 每隔多少秒在日志中输出各目标的写入延迟
+REDIS_REPLICAS = []
+REDIS_LAG_WARN = 5.0
+REDIS_STATS_INTERVAL = 60
+
+# 周期配置
+#   name:     周期名称（用于日志）
+#   ktype:    futu/moomoo 的 K 线类型，同时也是订阅类型（SubType 与 KLType 取值相同）
+#   x500:     每次 get_cur_kline 取的K线根数
+#   prefix:   Redis 键前缀，完整键名为 prefix + code + KEY_SUFFIX
+#   interval: 轮询周期在每根K线收盘后刷新（见 trading_calendar）；interval > 0 时交易时段内
+#             额外每隔 interval 秒刷新一次未收盘的K线，0 表示只在收盘后刷新
+#   mode:     'poll' 每轮 get_cur_kline 轮询；'push' 启动时抓取一次完整窗口，之后由 OpenD 推送增量K线
+#             （每隔 PUSH_FLUSH_INTERVAL 秒合并写入一次）；
+#             'derived' 启动时抓取一次完整窗口，之后由 source 周期在本地合成（见 bar_resample）
+#   tail:     轮询时首次完整抓取 keep 根，之后只抓最近 tail 根合并进缓存；0 表示每轮都完整抓取
+#   keep:     内存中保留的K线根数（默认等于 x500），作为合成的源周期时需要覆盖一整个目标周期
+#   source:   'derived' 模式下的源周期名称：1H、1D 由 1K 合成，1W 由 1D 合成
+#             合成结果可以先用 python bar_resample.py 与 OpenD 的K线逐根比对，再把 1H/1D/1W 切换为 'derived'，
+#             例如 {'name': '1H', ..., 'mode': 'derived', 'source': '1K'}
+#   snapshot: 'poll' 模式且 interval > 0 时，交易时段内的 interval 刷新改用 get_market_snapshot：
+#             一次请求最多 SNAPSHOT_BATCH 个代码，只更新最后一根K线，收盘后的刷新仍抓取K线；
+#             支持 K_1M、K_60M（按成交价合并）和 K_DAY（快照中的当日开高低收量整根替换）
+TIMEFRAMES = [
+    {'name': '1K', 'ktype': 'K_1M', 'x500': 50, 'prefix': 'BY54_1K_', 'interval': 0, 'mode': 'push', 'tail': 3,
+     'keep': 1000},
+    {'name': '1H', 'ktype': 'K_60M', 'x500': 50, 'prefix': 'BY54_1H_', 'interval': 0, 'mode': 'poll', 'tail': 2},
+    {'name': '1D', 'ktype': 'K_DAY', 'x500': 50, 'prefix': 'BY54_1D_', 'interval': 0, 'mode': 'poll', 'tail': 2},
+    {'name': '1W', 'ktype': 'K_WEEK', 'x500': 250, 'prefix': 'BY54_1W_', 'interval': 0, 'mode': 'poll', 'tail': 2},
+]
+
+# Redis 键后缀（与原脚本保持一致）
+KEY_SUFFIX = 'now_py1'
+
+# 整块键的序列化格式：'csv' 与原脚本相同；'npy' 为按列打包的二进制（见 bar_codec）
+# 所有读取端都换成 bar_codec.decode_frame 之后再改为 'npy'
+REDIS_CODEC = 'csv'
+
+# 整块键的压缩（见 bar_codec），读取端按头部自动识别，压缩和不压缩的值可以同时存在
+#   REDIS_COMPRESSION:       None 不压缩；'lz4' 或 'zstd'（需要写入端和读取端都安装 lz4 / zstandard）
+#   REDIS_COMPRESSION_LEVEL: 压缩级别，None 为默认级别；用 python bar_codec.py bench 比较各级别的压缩比和 CPU 时间
+#   REDIS_ZSTD_DICT:         zstd 字典文件（python bar_codec.py train 生成），读取端设置环境变量
+#                            BAR_CODEC_ZSTD_DICT 指向同一个文件
+REDIS_COMPRESSION = None
+REDIS_COMPRESSION_LEVEL = None
+REDIS_ZSTD_DICT = None
+
+# 按K线时间索引的存储（每个代码每个周期一个有序集合），与上面的整块 CSV 键并存
+#   BAR_STORE_ENABLED: 是否同时写入有序集合
+#   BAR_STORE_SUFFIX:  有序集合键后缀，完整键名为 prefix + code + BAR_STORE_SUFFIX
+BAR_STORE_ENABLED = True
+BAR_STORE_SUFFIX = 'now_zs'
+
+# 同机共享内存（见 bar_shm.py）：每个代码每个周期的K线同时写入一个命名共享内存段，
+# 同一台机器上的计算进程用 bar_shm.ShmBarReader 直接映射读取；跨机器仍读 Redis
+SHM_ENABLED = False
+
+# 后台写线程排队等待写入的批次上限，写入跟不上时抓取线程在提交处等待
+WRITER_MAX_PENDING = 8
+
+# 每轮变化的代码（见 redis_io.publish_dirty），下游据此只重算有变化的代码
+#   DIRTY_TTL: 每轮变化列表在 Redis 中保留的秒数，下游落后超过这个时间需要全部重算
+DIRTY_TTL = 3600
+
+# 成交推送驱动的未收盘 1 分钟K线（见 tick_bars.py），需要 TIMEFRAMES 中有 K_1M 周期
+#   TICK_PUSH:           None 关闭；'QUOTE' 订阅报价推送，'TICKER' 订阅逐笔推送（数据更全，推送量也更大），
+#                        每次推送更新未收盘的 1 分钟K线以及由它合成的周期（每个代码多占一份订阅额度）
+TICK_PUSH = None
+
+# CurKline 推送和成交推送先更新内存中的K线，每隔 PUSH_FLUSH_INTERVAL 秒合并写入 Redis 一次：
+# 期间同一代码的多次更新只写最后一次，每次写入每个周期只发布一个变化轮次（见 redis_io.publish_dirty）
+PUSH_FLUSH_INTERVAL = 0.5
+
+# get_market_snapshot 每次请求的代码数上限（OpenD 限制为 400）
+SNAPSHOT_BATCH = 400
+
+# 本地历史K线存储（由 backfill_history.py 回补，见 history_store）
+#   HISTORY_DIR:           存储根目录
+#   HISTORY_START:         首次回补的开始日期
+#   HISTORY_RATE:          request_history_kline 每秒请求数（OpenD 限制为每 30 秒 60 次）
+#   HISTORY_PAGE_SIZE:     每页K线根数
+#   HISTORY_LOAD_ON_START: 抓取服务启动时先从本地加载历史，只向 OpenD 请求尾部K线
+HISTORY_DIR = 'history'
+HISTORY_START = '2023-01-01'
+HISTORY_RATE = 1.5
+HISTORY_PAGE_SIZE = 1000
+HISTORY_LOAD_ON_START = True
+
+# 每轮抓取之间的最短等待时间（秒），对应原 .bat 中的 ping -w 100
+LOOP_SLEEP = 0.1
+
+# K线收盘后等待多少秒再刷新（等 OpenD 收到收盘K线）
+BAR_CLOSE_DELAY = 2
+
+# 休市时每次最多空闲等待的时间（秒）
+IDLE_SLEEP_MAX = 30
+
+# 按活跃度分配轮询周期的 interval 刷新（见 refresh_priority.py），收盘刷新仍抓取全部代码
+#   MAX_STALENESS:  冷门代码未收盘K线最长多少秒刷新一次；None 关闭，每次 interval 刷新都抓取全部代码
+#   ACTIVITY_ALPHA: 活跃度的指数平均系数，每次刷新后 活跃度 = (1-α)·活跃度 + α·(K线是否有变化)
+#   ACTIVITY_HOT:   活跃度不低于此值的代码每次 interval 刷新都抓取
+MAX_STALENESS = None
+ACTIVITY_ALPHA = 0.3
+ACTIVITY_HOT = 0.5
+
+# 盘前预热（见 kline_daemon.warm_up）：每个交易日到 WARMUP_TIME 时检查 Redis/MQTT 连接、按代码池重新订阅、
+# 补齐缓存（本地历史或 OpenD）并写出全部周期，开盘后第一轮只做增量更新
+#   WARMUP_TIME: 'HH:MM'，应早于 09:15 集合竞价（港股开市前时段 09:20 撮合）；None 关闭
+#   MQTT_CHECK:  预热时检查能否连上的 MQTT 服务器 (host, port)，如 ('192.168.102.16', 1883)；None 不检查
+WARMUP_TIME = '09:10'
+MQTT_CHECK = None
+
+# 交易所休市日（周末以外），以交易所公告为准，每年年底补充下一年
+HOLIDAYS = [
+    # 2025
+    '2025-01-01', '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31', '2025-02-03', '2025-02-04',
+    '2025-04-04', '2025-05-01', '2025-05-02', '2025-05-05', '2025-06-02',
+    '2025-10-01', '2025-10-02', '2025-10-03', '2025-10-06', '2025-10-07', '2025-10-08',
+    # 2026
+    '2026-01-01', '2026-01-02', '2026-02-16', '2026-02-17', '2026-02-18', '2026-02-19', '2026-02-20',
+    '2026-02-23', '2026-04-06', '2026-05-01', '2026-05-04', '2026-05-05', '2026-06-19',
+    '2026-09-25', '2026-10-01', '2026-10-02', '2026-10-05', '2026-10-06', '2026-10-07',
+]
+
+# 港股休市日（周末以外）和半日市（只有上午时段，农历除夕、平安夜、除夕），以香港交易所公告为准，每年年底补充下一年
+HK_HOLIDAYS = [
+    # 2025
+    '2025-01-01', '2025-01-29', '2025-01-30', '2025-01-31', '2025-04-04', '2025-04-18', '2025-04-21',
+    '2025-05-01', '2025-05-05', '2025-07-01', '2025-10-01', '2025-10-07', '2025-10-29', '2025-12-25', '2025-12-26',
+    # 2026
+    '2026-01-01', '2026-02-17', '2026-02-18', '2026-02-19', '2026-04-03', '2026-04-06', '2026-04-07',
+    '2026-05-01', '2026-05-25', '2026-06-19', '2026-07-01', '2026-10-01', '2026-10-19', '2026-12-25',
+]
+HK_HALF_DAYS = [
+    '2025-01-28', '2025-12-24', '2025-12-31',
+    '2026-02-16', '2026-12-24', '2026-12-31',
+]
+
+# 并发抓取引擎
+#   FETCH_WORKERS:     并发请求线程数
+#   FETCH_RATE:        每秒最多请求数（令牌桶补充速度），按 OpenD 的接口限频设置
+#   FETCH_BURST:       允许的突发请求数（令牌桶容量）
+#   FETCH_MAX_RETRIES: 限频或连接失败时的最大重试次数
+#   FETCH_BACKOFF:     退避基准时间（秒），第 n 次重试等待 FETCH_BACKOFF * 2^n 加随机抖动
+#   BREAKER_THRESHOLD: 连续多少次连接失败后熔断
+#   BREAKER_COOLDOWN:  熔断持续时间（秒）
+FETCH_WORKERS = 8
+FETCH_RATE = 20
+FETCH_BURST = 20
+FETCH_MAX_RETRIES = 3
+FETCH_BACKOFF = 0.5
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+
+# ETF88 代码列表
+CODELIST = ['159994.SZ', '515050.SH', '512930.SH', '159786.SZ', '512480.SH', '561980.SH', '512980.SH', '159805.SZ', '159992.SZ', '159363.SZ', '159796.SZ', '159755.SZ', '159611.SZ', '512200.SH', '515210.SH', '516320.SH', '515790.SH', '512670.SH', '159227.SZ', '510880.SH', '512890.SH', '159870.SZ', '512580.SH', '518880.SH', '159322.SZ', '159559.SZ', '562500.SH', '516970.SH', '159998.SZ', '513360.SH', '159851.SZ', '516860.SH', '512690.SH', '512660.SH', '512680.SH', '512710.SH', '588790.SH', '588930.SH', '588750.SH', '588200.SH', '588290.SH', '588780.SH', '588830.SH', '515000.SH', '159840.SZ', '159766.SZ', '515220.SH', '159930.SZ', '159825.SZ', '512000.SH', '515070.SH', '159819.SZ', '515980.SH', '588760.SH', '159852.SZ', '515170.SH', '159780.SZ', '159790.SZ', '515880.SH', '159583.SZ', '159206.SZ', '159218.SZ', '516780.SH', '562800.SH', '159928.SZ', '159732.SZ', '562950.SH', '159995.SZ', '159801.SZ', '515030.SH', '560700.SH', '512170.SH', '159883.SZ', '512010.SH', '512800.SH', '516010.SH', '159869.SZ', '159980.SZ', '512400.SH', '159876.SZ', '516510.SH', '159738.SZ', '512880.SH', '159993.SZ', '512070.SH', '515250.SH', '517180.SH', '515080.SH']
+
+# 恒生指数成分股
+HSI_CODELIST = ['HK.00001', 'HK.00002', 'HK.00003', 'HK.00005', 'HK.00006', 'HK.00011', 'HK.00012', 'HK.00016', 'HK.00017', 'HK.00027', 'HK.00066', 'HK.00101', 'HK.00175', 'HK.00241', 'HK.00267', 'HK.00288', 'HK.00291', 'HK.00316', 'HK.00322', 'HK.00386', 'HK.00388', 'HK.00669', 'HK.00688', 'HK.00700', 'HK.00762', 'HK.00823', 'HK.00836', 'HK.00857', 'HK.00868', 'HK.00881', 'HK.00883', 'HK.00939', 'HK.00941', 'HK.00960', 'HK.00968', 'HK.00981', 'HK.00992', 'HK.01038', 'HK.01044', 'HK.01088', 'HK.01093', 'HK.01099', 'HK.01109', 'HK.01113', 'HK.01177', 'HK.01209', 'HK.01211', 'HK.01299', 'HK.01378', 'HK.01398', 'HK.01810', 'HK.01876', 'HK.01928', 'HK.01929', 'HK.01997', 'HK.02015', 'HK.02020', 'HK.02269', 'HK.02313', 'HK.02318', 'HK.02319', 'HK.02331', 'HK.02359', 'HK.02382', 'HK.02388', 'HK.02628', 'HK.02688', 'HK.02899', 'HK.03690', 'HK.03692', 'HK.03968', 'HK.03988', 'HK.06098', 'HK.06618', 'HK.06690', 'HK.06862', 'HK.09618', 'HK.09633', 'HK.09888', 'HK.09961', 'HK.09988', 'HK.09999']
+
+# 恒生科技指数成分股
+HSTECH_CODELIST = ['HK.00020', 'HK.00241', 'HK.00268', 'HK.00285', 'HK.00700', 'HK.00772', 'HK.00981', 'HK.00992', 'HK.01024', 'HK.01347', 'HK.01797', 'HK.01810', 'HK.01833', 'HK.02015', 'HK.02382', 'HK.03690', 'HK.03888', 'HK.06060', 'HK.06618', 'HK.06690', 'HK.09618', 'HK.09626', 'HK.09698', 'HK.09866', 'HK.09868', 'HK.09888', 'HK.09898', 'HK.09961', 'HK.09988', 'HK.09999']
+
+# 代码池（见 universe.py），代码可以是通达信格式 '512480.SH' 或 futu 格式 'HK.00700'
+#   UNIVERSES:        代码池名称 -> 代码列表
+#   ACTIVE_UNIVERSES: 抓取服务使用的代码池，多个代码池取并集；代码池的市场要有交易日历（沪深、港股，
+#                     见 trading_calendar.CALENDARS），其它市场的代码池可以定义，启用时报错
+#   UNIVERSE_FILE:    可选的 JSON 文件，服务运行中修改后下一轮生效，只增减有变化的订阅
+#   UNIVERSE_KEY_PREFIX: 多个代码池共用周期的键命名空间，共有的代码只抓取、写入一次；各启用代码池的成员
+#                     写入集合 <前缀><名称>，启用的代码池名称写入 <前缀>active（JSON），下游按集合取自己的代码；
+#                     停用的代码池的集合会被删除
+UNIVERSES = {
+    'ETF88': CODELIST,
+    'HSI': HSI_CODELIST,
+    'HSTECH': HSTECH_CODELIST,
+}
+ACTIVE_UNIVERSES = ['ETF88']
+UNIVERSE_FILE = 'universes.json'
+UNIVERSE_KEY_PREFIX = 'BY54_UNIVERSE_'
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+并发抓取引擎
+有界线程池并发请求 OpenD，令牌桶限制请求频率，限频错误带抖动退避重试，
+OpenD 断开时熔断，失败的代码明确返回给调用方而不是静默跳过
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+try:
+    from moomoo import RET_OK
+except ImportError:
+    from futu import RET_OK
+
+logger = logging.getLogger(__name__)
+
+# OpenD 限频错误信息中的关键字
+THROTTLE_KEYWORDS = ('频率', '频繁', 'too frequent', 'frequency')
+
+# OpenD 连接异常错误信息中的关键字
+DISCONNECT_KEYWORDS = ('连接', '断开', 'connect', 'disconnect', 'timeout', '超时')
+
+
+class TokenBucket:
+    """令牌桶限频器，rate 为每秒补充的令牌数，burst 为桶容量"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，没有令牌时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续 threshold 次连接类失败后打开，cooldown 秒内请求直接失败，
+    冷却结束后放行请求试探，成功即关闭
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.cooldown
+
+    def check(self):
+        """熔断打开时抛出 CircuitOpenError"""
+        if self.is_open:
+            raise CircuitOpenError('OpenD 熔断中')
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.threshold:
+                if self._opened_at is None or time.monotonic() - self._opened_at >= self.cooldown:
+                    logger.error(f"OpenD 连续 {self._failures} 次连接失败，熔断 {self.cooldown} 秒")
+                self._opened_at = time.monotonic()
+
+
+class FetchResult:
+    """一次批量抓取的结果：ok 为成功的数据，failed 为失败代码及原因"""
+
+    def __init__(self):
+        self.ok: Dict[str, Any] = {}
+        self.failed: Dict[str, str] = {}
+
+
+def _match(message: str, keywords: Tuple[str, ...]) -> bool:
+    message = str(message).lower()
+    return any(keyword in message for keyword in keywords)
+
+
+class FetchEngine:
+    """并发、限频、可重试的 OpenD 请求引擎"""
+
+    def __init__(self, workers: int, rate: float, burst: int,
+                 max_retries: int, backoff_base: float,
+                 breaker_threshold: int, breaker_cooldown: float):
+        """
+        Args:
+            workers: 并发线程数
+            rate: 每秒最多请求数
+            burst: 允许的突发请求数
+            max_retries: 限频或连接失败时的最大重试次数
+            backoff_base: 退避基准时间（秒），第 n 次重试等待 base * 2^n 加随机抖动
+            breaker_threshold: 连续连接失败多少次后熔断
+            breaker_cooldown: 熔断持续时间（秒）
+        """
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+
+    def _backoff(self, attempt: int):
+        delay = self.backoff_base * (2 ** attempt)
+        time.sleep(delay + random.uniform(0, delay))
+
+    def request(self, request_fn: Callable[[str], Tuple[int, Any]], code: str) -> Tuple[bool, Any]:
+        """
+        对单个代码发起请求，限频错误和连接错误退避重试
+
+        Args:
+            request_fn: 请求函数，参数为代码，返回 (ret, data)
+            code: 代码
+
+        Returns:
+            tuple: (是否成功, 数据或错误信息)
+        """
+        message = ''
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.breaker.check()
+            except CircuitOpenError as e:
+                return False, str(e)
+
+            self.bucket.acquire()
+            try:
+                ret, data = request_fn(code)
+            except Exception as e:
+                ret, data = None, str(e)
+                self.breaker.record_failure()
+            else:
+                if ret == RET_OK:
+                    self.breaker.record_success()
+                    return True, data
+                if _match(data, DISCONNECT_KEYWORDS):
+                    self.breaker.record_failure()
+                elif not _match(data, THROTTLE_KEYWORDS):
+                    # 其它错误（代码不存在、未订阅等）重试没有意义
+                    return False, data
+
+            message = data
+            if attempt < self.max_retries:
+                self._backoff(attempt)
+
+        return False, message
+
+    def submit(self, request_fn: Callable[[str], Tuple[int, Any]], code: str) -> Future:
+        """在线程池中执行 request，返回结果为 (是否成功, 数据或错误信息) 的 Future"""
+        return self.executor.submit(self.request, request_fn, code)
+
+    def fetch_all(self, codes: List[str], request_fn: Callable[[str], Tuple[int, Any]]) -> FetchResult:
+        """
+        并发请求全部代码
+
+        Args:
+            codes: 代码列表
+            request_fn: 请求函数，参数为代码，返回 (ret, data)
+
+        Returns:
+            FetchResult: 成功与失败的代码
+        """
+        result = FetchResult()
+        futures = {code: self.submit(request_fn, code) for code in codes}
+        for code, future in futures.items():
+            ok, data = future.result()
+            if ok:
+                result.ok[code] = data
+            else:
+                result.failed[code] = str(data)
+        return result
+
+    def shutdown(self):
+        """关闭线程池"""
+        self.executor.shutdown(wait=True)
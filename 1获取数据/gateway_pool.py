@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+多 OpenD 网关分片
+代码按负载和订阅额度分到多个 OpenD，每个网关有自己的行情连接、订阅和限频引擎，各网关的请求额度叠加；
+网关熔断（连续连接失败，见 fetch_engine.CircuitBreaker）时它的代码迁到其它网关，
+冷却结束后用一次查询试探，恢复后按负载把代码迁回一部分
+"""
+
+import logging
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from moomoo import OpenQuoteContext, RET_OK
+except ImportError:
+    from futu import OpenQuoteContext, RET_OK
+
+import fetch_config
+from fetch_engine import FetchEngine, FetchResult
+from kline_push import KlinePushHandler
+from opend_replay import open_quote_context
+from subscription import SubscriptionManager
+from tick_bars import TICK_HANDLERS
+
+logger = logging.getLogger(__name__)
+
+
+class Gateway:
+    """一个 OpenD 网关：行情连接、订阅状态和限频引擎"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.quote_ctx: Optional[OpenQuoteContext] = None
+        self.subscriptions: Optional[SubscriptionManager] = None
+        self.engine = FetchEngine(workers=fetch_config.FETCH_WORKERS,
+                                  rate=fetch_config.FETCH_RATE,
+                                  burst=fetch_config.FETCH_BURST,
+                                  max_retries=fetch_config.FETCH_MAX_RETRIES,
+                                  backoff_base=fetch_config.FETCH_BACKOFF,
+                                  breaker_threshold=fetch_config.BREAKER_THRESHOLD,
+                                  breaker_cooldown=fetch_config.BREAKER_COOLDOWN)
+        self.healthy = True
+
+    def capacity(self) -> float:
+        """按订阅额度最多能放的代码数，额度未知时不限"""
+        subs = self.subscriptions
+        if subs.remain is None:
+            return float('inf')
+        return len(subs.subscribed) + subs.remain // max(subs.types_per_code, 1)
+
+    def probe(self) -> bool:
+        """熔断冷却结束后试探网关是否恢复"""
+        ret, _ = self.quote_ctx.query_subscription(is_all_conn=True)
+        if ret == RET_OK:
+            self.engine.breaker.record_success()
+            return True
+        self.engine.breaker.record_failure()
+        return False
+
+
+class GatewayPool:
+    """把代码分片到多个 OpenD 网关"""
+
+    def __init__(self, endpoints: List[Tuple[str, int]],
+                 rebalance_slack: int = fetch_config.GATEWAY_REBALANCE_SLACK):
+        """
+        Args:
+            endpoints: OpenD 地址列表 [(host, port), ...]
+            rebalance_slack: 各网关代码数相差超过这个数时迁移代码
+        """
+        self.gateways = [Gateway(host, port) for host, port in endpoints]
+        self.rebalance_slack = rebalance_slack
+        # 代码 -> 所在网关
+        self.home: Dict[str, Gateway] = {}
+
+    def connect(self, poll_types: List[str], push_types: List[str], push_callback: Callable,
+                tick_type: Optional[str] = None, tick_callback: Optional[Callable] = None):
+        """
+        建立全部网关的行情连接
+
+        Args:
+            poll_types: 只订阅、不推送给脚本的K线类型
+            push_types: 需要推送给脚本的订阅类型（K线类型，以及 tick_type）
+            push_callback: CurKline 推送的处理函数，所有网关共用
+            tick_type: 成交推送类型 'QUOTE' 或 'TICKER'（见 tick_bars），None 表示不处理成交推送
+            tick_callback: 成交推送的处理函数，所有网关共用
+        """
+        for gw in self.gateways:
+            gw.quote_ctx = open_quote_context(gw.host, gw.port)
+            gw.quote_ctx.set_handler(KlinePushHandler(push_callback))
+            if tick_type is not None:
+                gw.quote_ctx.set_handler(TICK_HANDLERS[tick_type](tick_callback))
+            gw.subscriptions = SubscriptionManager(gw.quote_ctx, poll_types, push_types)
+            gw.subscriptions.refresh_quota()
+
+    def available(self) -> bool:
+        """是否至少有一个可用的网关"""
+        return any(gw.healthy for gw in self.gateways)
+
+    def check_health(self) -> bool:
+        """
+        更新各网关的健康状态：熔断的网关标记为不可用，它的订阅视为已失效；冷却结束后试探恢复
+
+        Returns:
+            bool: 是否有网关状态变化
+        """
+        changed = False
+        for gw in self.gateways:
+            if gw.healthy and gw.engine.breaker.is_open:
+                gw.healthy = False
+                gw.subscriptions.subscribed.clear()
+                moved = [code for code, home in self.home.items() if home is gw]
+                logger.error(f"OpenD {gw.name} 不可用，{len(moved)} 个代码迁到其它网关")
+                changed = True
+            elif not gw.healthy and not gw.engine.breaker.is_open and gw.probe():
+                gw.healthy = True
+                gw.subscriptions.refresh_quota()
+                logger.info(f"OpenD {gw.name} 已恢复")
+                changed = True
+        return changed
+
+    def assign(self, codes: List[str]) -> List[str]:
+        """
+        把代码分到可用的网关并按差异调整各网关的订阅
+
+        已在可用网关上的代码不动；新增代码和不可用网关上的代码放到代码最少、额度还够的网关；
+        各网关代码数相差超过 rebalance_slack 时从最多的网关迁出
+
+        Args:
+            codes: 需要订阅的全部代码
+
+        Returns:
+            List[str]: 订阅成功的代码，按 codes 的顺序
+        """
+        healthy = [gw for gw in self.gateways if gw.healthy]
+        if not healthy:
+            logger.error("没有可用的 OpenD")
+            return []
+
+        shards: Dict[Gateway, List[str]] = {gw: [] for gw in healthy}
+        homeless = []
+        for code in codes:
+            gw = self.home.get(code)
+            if gw in shards:
+                shards[gw].append(code)
+            else:
+                homeless.append(code)
+
+        for code in homeless:
+            room = [gw for gw in healthy if len(shards[gw]) < gw.capacity()]
+            if not room:
+                logger.error(f"所有 OpenD 的订阅额度已满，{len(homeless)} 个代码暂不订阅")
+                break
+            shards[min(room, key=lambda g: len(shards[g]))].append(code)
+
+        while len(healthy) > 1:
+            heavy = max(healthy, key=lambda g: len(shards[g]))
+            light = min(healthy, key=lambda g: len(shards[g]))
+            if len(shards[heavy]) - len(shards[light]) <= self.rebalance_slack or \
+                    len(shards[light]) >= light.capacity():
+                break
+            shards[light].append(shards[heavy].pop())
+
+        subscribed = set()
+        self.home = {}
+        # 先订阅迁入代码的网关，再反订阅迁出的，迁移过程中代码始终有订阅
+        for gw in sorted(healthy, key=lambda g: len(g.subscriptions.subscribed) - len(shards[g])):
+            if gw.subscriptions.pending(shards[gw]):
+                gw.subscriptions.sync(shards[gw])
+            for code in shards[gw]:
+                if code in gw.subscriptions.subscribed:
+                    self.home[code] = gw
+                    subscribed.add(code)
+        return [code for code in codes if code in subscribed]
+
+    def fetch_all(self, codes: List[str],
+                  request_fn: Callable[[OpenQuoteContext, str], Tuple[int, Any]]) -> FetchResult:
+        """
+        每个代码在所在网关上请求，各网关并发、各自限频
+
+        Args:
+            codes: 代码列表
+            request_fn: 请求函数，参数为 (行情连接, 代码)，返回 (ret, data)
+
+        Returns:
+            FetchResult: 成功与失败的代码
+        """
+        result = FetchResult()
+        futures = {}
+        for code in codes:
+            gw = self.home.get(code)
+            if gw is None or not gw.healthy:
+                result.failed[code] = '所在 OpenD 不可用'
+                continue
+            futures[code] = gw.engine.submit(partial(request_fn, gw.quote_ctx), code)
+
+        for code, future in futures.items():
+            ok, data = future.result()
+            if ok:
+                result.ok[code] = data
+            else:
+                result.failed[code] = str(data)
+        return result
+
+    def fetch_batches(self, codes: List[str], batch_size: int,
+                      request_fn: Callable[[OpenQuoteContext, List[str]], Tuple[int, Any]]) -> FetchResult:
+        """
+        按所在网关把代码分批，每批一次请求（如 get_market_snapshot），各网关并发、各自限频
+
+        Args:
+            codes: 代码列表
+            batch_size: 每批最多的代码数
+            request_fn: 请求函数，参数为 (行情连接, 代码列表)，返回 (ret, data)
+
+        Returns:
+            FetchResult: ok 为 批次（代码元组）-> 数据，failed 为 代码 -> 错误信息
+        """
+        result = FetchResult()
+        shards: Dict[Gateway, List[str]] = {}
+        for code in codes:
+            gw = self.home.get(code)
+            if gw is None or not gw.healthy:
+                result.failed[code] = '所在 OpenD 不可用'
+                continue
+            shards.setdefault(gw, []).append(code)
+
+        futures = {}
+        for gw, shard in shards.items():
+            for i in range(0, len(shard), batch_size):
+                batch = tuple(shard[i:i + batch_size])
+                futures[batch] = gw.engine.submit(partial(request_fn, gw.quote_ctx), list(batch))
+
+        for batch, future in futures.items():
+            ok, data = future.result()
+            if ok:
+                result.ok[batch] = data
+            else:
+                result.failed.update((code, str(data)) for code in batch)
+        return result
+
+    def close(self):
+        """关闭全部行情连接和线程池"""
+        for gw in self.gateways:
+            if gw.quote_ctx is not None:
+                # 关闭连接后 OpenD 会在1分钟后自动取消相应订阅
+                gw.quote_ctx.close()
+                gw.quote_ctx = None
+            gw.engine.shutdown()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+本地历史K线存储
+目录结构为 <根目录>/<周期>/<代码>/<分区>.bar，分钟、小时K按日分区（YYYY-MM-DD），日、周K按年分区（YYYY）
+每个文件是 bar_codec 的 npy 二进制格式，读取时内存映射文件，按列还原为数组，不解析文本
+"""
+
+import mmap
+import os
+import shutil
+from typing import List, Optional
+
+import pandas as pd
+
+from bar_codec import CODEC_NPY, decode_arrays, encode_frame
+
+# 按年分区的周期，其余按日分区
+YEARLY_TIMEFRAMES = ('1D', '1W')
+
+FILE_SUFFIX = '.bar'
+
+
+class HistoryStore:
+    """按 周期/代码/日期 分区的本地K线存储"""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root: 存储根目录
+        """
+        self.root = root
+
+    def partition_key(self, tf_name: str, dt: pd.Series) -> pd.Series:
+        """每根K线所属的分区名"""
+        fmt = '%Y' if tf_name in YEARLY_TIMEFRAMES else '%Y-%m-%d'
+        return dt.dt.strftime(fmt)
+
+    def code_dir(self, tf_name: str, code: str) -> str:
+        return os.path.join(self.root, tf_name, code)
+
+    def partitions(self, tf_name: str, code: str) -> List[str]:
+        """某代码已有的分区名，按时间升序"""
+        path = self.code_dir(tf_name, code)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name[:-len(FILE_SUFFIX)] for name in os.listdir(path) if name.endswith(FILE_SUFFIX))
+
+    def read_partition(self, tf_name: str, code: str, partition: str) -> pd.DataFrame:
+        """
+        内存映射读取一个分区
+
+        映射在返回前关闭（Windows 下文件被映射时无法被替换），数组只复制一次到数据框
+
+        Returns:
+            pandas.DataFrame: 分区内的K线，文件不存在时返回空数据框
+        """
+        path = os.path.join(self.code_dir(tf_name, code), partition + FILE_SUFFIX)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            arrays = decode_arrays(mm)
+            df = pd.DataFrame({name: arr.copy() for name, arr in arrays.items()})
+            del arrays
+        return df
+
+    def write_bars(self, tf_name: str, code: str, bars: pd.DataFrame):
+        """
+        写入K线：按分区与已有数据合并（同一时间以新数据为准），先写临时文件再替换，中断也不会留下半个文件
+
+        Args:
+            tf_name: 周期名称
+            code: 代码
+            bars: 要写入的K线，含 DateTime 列
+        """
+        if bars.empty:
+            return
+
+        path = self.code_dir(tf_name, code)
+        os.makedirs(path, exist_ok=True)
+
+        for partition, part in bars.groupby(self.partition_key(tf_name, bars['DateTime'])):
+            old = self.read_partition(tf_name, code, partition)
+            if not old.empty:
+                old = old[~old['DateTime'].isin(part['DateTime'])]
+                part = pd.concat([old, part])
+            part = part.sort_values(by='DateTime').reset_index(drop=True)
+
+            file_name = os.path.join(path, partition + FILE_SUFFIX)
+            with open(file_name + '.tmp', 'wb') as f:
+                f.write(encode_frame(part, CODEC_NPY))
+            os.replace(file_name + '.tmp', file_name)
+
+    def drop_code(self, tf_name: str, code: str):
+        """删除某代码一个周期的全部历史（复权因子变化后整段重新回补）"""
+        shutil.rmtree(self.code_dir(tf_name, code), ignore_errors=True)
+
+    def last_time(self, tf_name: str, code: str) -> Optional[pd.Timestamp]:
+        """已存储的最后一根K线时间，没有数据时返回 None"""
+        partitions = self.partitions(tf_name, code)
+        if not partitions:
+            return None
+        last = self.read_partition(tf_name, code, partitions[-1])
+        return None if last.empty else last['DateTime'].iloc[-1]
+
+    def load_tail(self, tf_name: str, code: str, n: int) -> pd.DataFrame:
+        """
+        读取最近 n 根K线（从最新的分区往前读，够 n 根为止）
+
+        Returns:
+            pandas.DataFrame: 按 DateTime 升序的K线，没有数据时返回空数据框
+        """
+        frames = []
+        count = 0
+        for partition in reversed(self.partitions(tf_name, code)):
+            part = self.read_partition(tf_name, code, partition)
+            frames.append(part)
+            count += len(part)
+            if count >= n:
+                break
+
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames[::-1]).iloc[-n:].reset_index(drop=True)
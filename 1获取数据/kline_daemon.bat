@@ -0,0 +1,8 @@
+@echo off
+:loop
+
+cd D:\MOO-ETF88
+:: daemon runs until killed; restart only if it exits
+python kline_daemon.py
+ping localhost -n 1 -w 1000 > nul
+goto loop
\ No newline at end of file
@@ -0,0 +1,949 @@
+# -*- coding: utf-8 -*-
+"""
+常驻多周期K线抓取服务
+保持行情连接和订阅常驻（可以分片到多个 OpenD，见 gateway_pool），在同一进程内轮流刷新 1K/1H/1D/1W，
+取代 001-futu1-redis_KEJI-no-{1K,1H,1D,1W}-*.py 四个每轮都重启的脚本
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import redis
+
+try:
+    from moomoo import AuType
+except ImportError:
+    from futu import AuType
+
+import fetch_config
+from gateway_pool import GatewayPool
+from history_store import HistoryStore
+from bar_cache import KlineSeriesStore, has_gap
+from bar_codec import BAR_COLUMNS, codec_stats, encode_frame, load_zstd_dictionary
+from bar_ring import BarRing, frame_to_arrays
+from bar_shm import ShmBarWriter, shm_name
+from bar_resample import resample_bars
+from redis_bar_store import replace_bars, upsert_bars
+from redis_io import create_redis_pool, pandas_to_redis, publish_active_universes, publish_universe
+from redis_writer import RedisFanoutWriter, WriteBatch
+from refresh_priority import RefreshPriority
+from tick_bars import (TICK_TYPES, aggregate_ticks, day_bars_from_snapshot, ticks_from_quote, ticks_from_snapshot,
+                       ticks_from_ticker)
+from trading_calendar import (DEFAULT_MARKETS, in_session, is_trading_day, last_boundary, market_of, next_boundary,
+                              session_open)
+from universe import UniverseRegistry
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 重命名列
+NEW_COLUMN_NAMES = {
+    'code': 'Code',
+    'name': 'Name',
+    'time_key': 'DateTime',
+    'open': 'Open',
+    'close': 'Close',
+    'high': 'High',
+    'low': 'Low',
+    'volume': 'Volume',
+    'turnover': 'Turnover',
+    'pe_ratio': 'PE_Ratio',
+    'turnover_rate': 'Turnover_Rate',
+    'last_close': 'Last_Close'
+}
+
+# get_cur_kline 和推送中 time_key 的格式
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 可以用 get_market_snapshot 刷新最后一根K线的周期（见 refresh_snapshot）
+SNAPSHOT_KTYPES = ('K_1M', 'K_60M', 'K_DAY')
+
+
+def normalize_kline(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    将 get_cur_kline 返回的数据整理为 Redis 存储格式
+
+    Args:
+        data: get_cur_kline 返回的原始数据框
+
+    Returns:
+        pandas.DataFrame: 列为 BAR_COLUMNS、按 DateTime 升序的数据框
+    """
+    data = data.rename(columns=NEW_COLUMN_NAMES)
+    data = data.reindex(columns=BAR_COLUMNS)
+    data['DateTime'] = pd.to_datetime(data['DateTime'])
+    return data.sort_values(by='DateTime', ascending=True)
+
+
+def _normalize_groups(data: pd.DataFrame, group: np.ndarray, keys: List[Any]) -> Dict[Any, pd.DataFrame]:
+    """
+    一次整理拼接在一起的多组原始K线，再按组拆开
+
+    Args:
+        data: 拼接后的原始数据框
+        group: 每一行所属组的序号（0 ~ len(keys)-1）
+        keys: 各组的键
+
+    Returns:
+        Dict: 键 -> 整理后的K线（同 normalize_kline）
+    """
+    data = data.rename(columns=NEW_COLUMN_NAMES).reindex(columns=BAR_COLUMNS)
+    data['DateTime'] = pd.to_datetime(data['DateTime'], format=TIME_FORMAT)
+    # 先按组、组内按时间排序，每组就是连续的一段
+    order = np.lexsort((data['DateTime'].to_numpy(), group))
+    data = data.take(order)
+    bounds = np.searchsorted(group[order], np.arange(len(keys) + 1))
+    return {key: data.iloc[bounds[i]:bounds[i + 1]] for i, key in enumerate(keys)}
+
+
+def normalize_klines(frames: Dict[Any, pd.DataFrame]) -> Dict[Any, pd.DataFrame]:
+    """
+    批量整理一轮抓取的全部原始K线：拼接一次、转换一次时间、排序一次，最后按代码拆开，
+    避免每个代码的小数据框各自 rename/reindex/to_datetime/sort_values 的调用开销
+
+    Args:
+        frames: 代码 -> get_cur_kline 返回的原始数据框
+
+    Returns:
+        Dict: 代码 -> 整理后的K线（同 normalize_kline）
+    """
+    if not frames:
+        return {}
+    keys = list(frames)
+    group = np.repeat(np.arange(len(keys)), [len(frames[key]) for key in keys])
+    data = pd.concat([frames[key] for key in keys], ignore_index=True)
+    return _normalize_groups(data, group, keys)
+
+
+def normalize_push(data: pd.DataFrame) -> Dict[Tuple[str, str], pd.DataFrame]:
+    """
+    整理一次 CurKline 推送（可能包含多个代码、多个周期）
+
+    Args:
+        data: futu 推送的原始数据框，含 k_type、code 列
+
+    Returns:
+        Dict: (K线类型, 代码) -> 整理后的K线
+    """
+    data = data.reset_index(drop=True)
+    group, uniques = pd.factorize(pd.MultiIndex.from_arrays([data['k_type'], data['code']]))
+    return _normalize_groups(data, group, list(uniques))
+
+
+class KlineFetchDaemon:
+    """常驻K线抓取服务，每个 OpenD 一个行情连接 + 一次订阅服务所有周期"""
+
+    def __init__(self, registry: UniverseRegistry, timeframes: List[dict],
+                 endpoints: List[Tuple[str, int]] = fetch_config.OPEND_ENDPOINTS,
+                 redis_host: str = fetch_config.REDIS_HOST,
+                 redis_port: int = fetch_config.REDIS_PORT,
+                 redis_db: int = fetch_config.REDIS_DB):
+        """
+        初始化抓取服务
+
+        Args:
+            registry: 代码池注册表，抓取其中启用的代码池
+            timeframes: 周期配置列表，格式见 fetch_config.TIMEFRAMES
+            endpoints: OpenD 地址列表 [(host, port), ...]，代码分片到各网关
+            redis_host: Redis服务器地址
+            redis_port: Redis端口
+            redis_db: Redis数据库编号
+        """
+        self.registry = registry
+        # 当前抓取的代码：启用代码池中已订阅成功的代码（多个代码池去重），见 refresh_universe
+        self.codelist: List[str] = []
+        # 这些代码所在的市场，收盘时间、交易时段按这些市场的交易日历（见 trading_calendar）
+        self.markets: Tuple[str, ...] = DEFAULT_MARKETS
+        # 上一次写出的各代码池成员（见 publish_universe_index）
+        self.universe_index: Dict[str, List[str]] = {}
+        self.timeframes = timeframes
+
+        if fetch_config.REDIS_ZSTD_DICT:
+            load_zstd_dictionary(fetch_config.REDIS_ZSTD_DICT)
+        # 编码在写线程中进行，配置错误（拼写、没有安装压缩库）在那里只会让同一批写入无限重试，启动时先试编码一次
+        try:
+            encode_frame(BarRing(1).to_frame(), fetch_config.REDIS_CODEC, fetch_config.REDIS_COMPRESSION,
+                         fetch_config.REDIS_COMPRESSION_LEVEL)
+        except Exception as e:
+            raise ValueError(f"REDIS_CODEC={fetch_config.REDIS_CODEC!r}、REDIS_COMPRESSION="
+                             f"{fetch_config.REDIS_COMPRESSION!r} 无法使用: {e}") from e
+
+        self.redis_pool = create_redis_pool(redis_host, redis_port, redis_db)
+        # 写入同时复制到 REDIS_REPLICAS；变化轮次等只从主 Redis 读取
+        self.replica_pools = {f"{host}:{port}/{db}": create_redis_pool(host, port, db)
+                              for host, port, db in fetch_config.REDIS_REPLICAS}
+        self.writer = RedisFanoutWriter(self.redis_pool, self.replica_pools,
+                                        max_pending=fetch_config.WRITER_MAX_PENDING)
+        self.last_stats_log = time.time()
+        self.gateways = GatewayPool(endpoints)
+        # 同机计算进程的共享内存出口（见 bar_shm），与 Redis 并存
+        self.shm = ShmBarWriter() if fetch_config.SHM_ENABLED else None
+
+        # 各周期上次刷新的时间
+        self.last_refresh: Dict[str, float] = {}
+        self.pass_count = 0
+
+        # 每个代码每个周期的K线缓存：轮询周期首次完整抓取后只抓尾部合并，
+        # 推送、合成周期启动时完整抓取一次作为种子，之后只处理推送或由源周期合成
+        self.tf_by_ktype = {tf['ktype']: tf for tf in timeframes}
+        self.tf_by_name = {tf['name']: tf for tf in timeframes}
+        self.series_store = KlineSeriesStore()
+        self.history = HistoryStore(fetch_config.HISTORY_DIR) if fetch_config.HISTORY_LOAD_ON_START else None
+
+        # 源周期名称 -> 由它合成的周期列表
+        self.derived_by_source: Dict[str, List[dict]] = {}
+        for tf in timeframes:
+            if tf.get('mode', 'poll') == 'derived':
+                self.derived_by_source.setdefault(tf['source'], []).append(tf)
+
+        # 每个周期每个代码上次写入内容的指纹，内容没变时跳过写入
+        self.fingerprints: Dict[Tuple[str, str], bytes] = {}
+        # 各周期已发布的变化轮次（推送写入线程和主循环都会发布）
+        self.dirty_pass: Dict[str, int] = {}
+        self.dirty_lock = threading.Lock()
+
+        # 成交推送更新未收盘的 1 分钟K线（见 tick_bars）
+        self.tick_type = fetch_config.TICK_PUSH
+        self.tick_tf = self.tf_by_ktype.get('K_1M')
+        if self.tick_type is not None and (self.tick_type not in TICK_TYPES or self.tick_tf is None):
+            logger.error(f"TICK_PUSH={self.tick_type!r} 无效或没有 K_1M 周期，不处理成交推送")
+            self.tick_type = None
+        # QUOTE 推送和快照：代码 -> 上一次的累计成交量
+        self.quote_volume: Dict[str, int] = {}
+
+        # CurKline 推送和成交推送只更新内存序列、记下变化，由写入线程每隔 PUSH_FLUSH_INTERVAL 秒合并写入（见 flush_pushes）
+        # (K线类型, 代码) -> 上次写入后最早变化的K线时间
+        self.push_pending: Dict[Tuple[str, str], pd.Timestamp] = {}
+        self.push_lock = threading.Lock()
+        self.push_stop = threading.Event()
+        self.push_thread: Optional[threading.Thread] = None
+
+        # 上一次检查推送周期复权变化的日期，以及发现复权变化、不再从本地历史加载的代码（见 invalidate_code）
+        self.adjust_checked: Optional[date] = None
+        self.adjusted: Set[str] = set()
+
+        # 轮询周期 interval 刷新按活跃度选择代码（见 refresh_priority）
+        self.priority = (RefreshPriority(fetch_config.MAX_STALENESS, fetch_config.ACTIVITY_ALPHA,
+                                         fetch_config.ACTIVITY_HOT)
+                         if fetch_config.MAX_STALENESS else None)
+
+        # 盘前预热的时间和上一次预热的日期（见 warm_up）
+        self.warmup_time = (datetime.strptime(fetch_config.WARMUP_TIME, '%H:%M').time()
+                            if fetch_config.WARMUP_TIME else None)
+        self.warmed: Optional[date] = None
+
+        # 收盘之间用快照刷新最后一根K线的周期名称（见 refresh_snapshot）
+        self.snapshot_names: Set[str] = set()
+        for tf in timeframes:
+            if not tf.get('snapshot'):
+                continue
+            if tf['ktype'] in SNAPSHOT_KTYPES and tf.get('mode', 'poll') == 'poll':
+                self.snapshot_names.add(tf['name'])
+            else:
+                logger.error(f"{tf['name']} 不支持快照刷新，仍抓取K线")
+
+    def get_redis_client(self) -> redis.Redis:
+        """获取Redis客户端连接"""
+        return redis.Redis(connection_pool=self.redis_pool)
+
+    def connect(self) -> bool:
+        """
+        建立各 OpenD 的行情连接，并订阅启用代码池的全部周期
+
+        Returns:
+            bool: 订阅是否成功
+        """
+        # 合成周期也要订阅，启动时的种子数据仍通过 get_cur_kline 获取
+        # 轮询周期 subscribe_push=False：OpenD 持续接收推送，但暂时不需要推送给脚本
+        poll_types = [tf['ktype'] for tf in self.timeframes if tf.get('mode', 'poll') != 'push']
+        push_types = [tf['ktype'] for tf in self.timeframes if tf.get('mode', 'poll') == 'push']
+        if self.tick_type is not None:
+            push_types.append(self.tick_type)
+        self.gateways.connect(poll_types, push_types, self.on_kline_push, self.tick_type, self.on_tick_push)
+
+        self.refresh_universe()
+        if not self.codelist:
+            logger.error("没有订阅成功的代码")
+            return False
+
+        logger.info(f"已订阅 {len(self.codelist)} 个代码, 轮询周期: {poll_types}, 推送周期: {push_types}")
+        if push_types:
+            self.push_thread = threading.Thread(target=self.flush_pushes_loop, name='push-flush', daemon=True)
+            self.push_thread.start()
+        return True
+
+    def refresh_universe(self):
+        """
+        代码池或网关状态有变化时按差异增减订阅，并更新抓取的代码列表
+
+        移出的代码丢弃缓存；新增的代码让所有周期在本轮刷新（只有新代码需要完整抓取）；
+        换了网关的代码，以及所在网关刚从不可用恢复的代码（不可用期间订阅已失效），丢弃推送周期的缓存
+        重新抓取种子，补上迁移或中断期间漏掉的推送；所有网关都不可用时保留当前的代码、缓存和代码池索引，等网关恢复（期间 run_pass 不抓取）
+        """
+        self.registry.reload()
+        wanted = self.registry.codes()
+        homes = dict(self.gateways.home)
+        down = [gw for gw in self.gateways.gateways if not gw.healthy]
+        self.gateways.check_health()
+        recovered = {gw for gw in down if gw.healthy}
+        if not self.gateways.available():
+            logger.error(f"没有可用的 OpenD，暂停抓取，保留当前 {len(self.codelist)} 个代码的缓存")
+            return
+        codelist = self.gateways.assign(wanted)
+
+        push_ktypes = [tf['ktype'] for tf in self.timeframes if tf.get('mode', 'poll') == 'push']
+        for code in codelist:
+            if code in homes and (homes[code] in recovered or homes[code] is not self.gateways.home.get(code)):
+                self.series_store.drop(code, push_ktypes)
+
+        self.publish_universe_index(codelist)
+        if codelist == self.codelist:
+            return
+
+        for code in set(self.codelist) - set(codelist):
+            self.series_store.drop(code)
+            for tf in self.timeframes:
+                self.fingerprints.pop((tf['ktype'], code), None)
+            if self.priority is not None:
+                self.priority.drop(code)
+        if set(codelist) - set(self.codelist):
+            self.last_refresh.clear()
+        self.codelist = codelist
+        self.markets = tuple(sorted({market_of(code) for code in codelist})) or DEFAULT_MARKETS
+
+    def publish_universe_index(self, codelist: List[str]):
+        """
+        启用代码池或订阅成功的代码有变化时，写出各代码池的成员集合（只含订阅成功、会被写入的代码）；
+        多个代码池共有的代码只抓取、写入一次
+
+        Args:
+            codelist: 本轮抓取的代码
+        """
+        subscribed = set(codelist)
+        index = {name: [code for code in codes if code in subscribed]
+                 for name, codes in self.registry.active_members().items()}
+        if index == self.universe_index:
+            return
+
+        prefix = fetch_config.UNIVERSE_KEY_PREFIX
+        previous = list(self.universe_index)
+        if not previous:
+            # 启动后第一次写出：上次运行启用的代码池从 Redis 读取，停用了的同样要删除
+            try:
+                previous = json.loads(self.get_redis_client().get(prefix + 'active') or '[]')
+            except (redis.RedisError, ValueError) as e:
+                logger.warning(f"读取上次启用的代码池失败: {e}")
+        removed = [name for name in previous if name not in index]
+        self.universe_index = index
+
+        # 每个集合单独一个键：积压时多次写出合并，停用的代码池的删除不会被之后的写出覆盖掉
+        batch = WriteBatch()
+        for name in removed:
+            batch.put(prefix + name, partial(publish_universe, prefix=prefix, name=name, codes=[]))
+        for name, codes in index.items():
+            batch.put(prefix + name, partial(publish_universe, prefix=prefix, name=name, codes=codes))
+        batch.put(prefix + 'active', partial(publish_active_universes, prefix=prefix, names=list(index)))
+        self.writer.submit(batch)
+        total = sum(len(codes) for codes in index.values())
+        logger.info(f"代码池 {', '.join(f'{name}({len(codes)})' for name, codes in index.items())}: "
+                    f"共 {total} 个代码，去重后抓取 {len(subscribed)} 个")
+
+    def write_series(self, batch: WriteBatch, tf: dict, code: str, changed: Optional[pd.DataFrame] = None) -> bool:
+        """
+        把一个代码缓存中的K线加入写入批次：整块键总是整体重写；有序集合只更新变化的K线
+        要写入的窗口与上次写入的指纹相同时跳过（直接对缓存数组计算指纹，不组装数据框）
+
+        Args:
+            batch: 本轮的写入批次
+            tf: 周期配置
+            code: 代码
+            changed: 本次变化的K线，None 表示整个序列都重新抓取过
+
+        Returns:
+            bool: 是否加入了写入（False 表示内容没有变化或没有缓存）
+        """
+        # 内存中可能保留了比 x500 更多的K线（供合成使用），写入时只取最近 x500 根
+        result = self.series_store.window(tf['ktype'], code, tf['x500'], self.fingerprints.get((tf['ktype'], code)))
+        if result is None or result[1] is None:
+            return False
+        digest, series = result
+        self.fingerprints[(tf['ktype'], code)] = digest
+
+        key_name = tf['prefix'] + code + fetch_config.KEY_SUFFIX
+        # 编码在写线程中进行，复制到多个 Redis 时只编码一次
+        encoded = {}
+        batch.put(key_name, lambda pipe: pandas_to_redis(pipe, key_name, series, fetch_config.REDIS_CODEC,
+                                                         fetch_config.REDIS_COMPRESSION,
+                                                         fetch_config.REDIS_COMPRESSION_LEVEL, encoded))
+        if self.shm is not None:
+            # 共享内存立即更新，不等后台写线程
+            self.shm.publish(shm_name(key_name), frame_to_arrays(series), tf['x500'])
+
+        if fetch_config.BAR_STORE_ENABLED:
+            zset_key = tf['prefix'] + code + fetch_config.BAR_STORE_SUFFIX
+            if changed is None:
+                batch.put(zset_key, lambda pipe: replace_bars(pipe, zset_key, series))
+            else:
+                batch.put(zset_key, lambda pipe: upsert_bars(pipe, zset_key, changed, tf['x500']),
+                          replace=False, full=lambda pipe: replace_bars(pipe, zset_key, series))
+        return True
+
+    def next_dirty_pass(self, tf: dict) -> int:
+        """
+        某周期下一个变化轮次；进程重启后从 Redis 中的最新轮次接着递增，保证单调（调用方持有 dirty_lock）
+
+        Args:
+            tf: 周期配置
+
+        Returns:
+            int: 轮次
+        """
+        if tf['name'] not in self.dirty_pass:
+            last = self.get_redis_client().get(tf['prefix'] + 'pass')
+            self.dirty_pass[tf['name']] = int(last or 0)
+        self.dirty_pass[tf['name']] += 1
+        return self.dirty_pass[tf['name']]
+
+    def submit_dirty(self, batch: WriteBatch, dirty: Dict[str, Set[str]]):
+        """
+        把各周期本轮变化的代码加入写入批次（与K线在同一个事务中生效，键名见 redis_io.publish_dirty）并提交
+
+        推送写入线程（见 flush_pushes）和主循环都会发布 1K 的轮次：分配轮次和提交在同一把锁内，
+        各写线程按轮次顺序收到批次，<prefix>pass 不会倒退
+
+        Args:
+            batch: 本轮的写入批次
+            dirty: 周期名称 -> 变化的代码
+        """
+        with self.dirty_lock:
+            for tf_name, codes in dirty.items():
+                tf = self.tf_by_name[tf_name]
+                batch.put_dirty(tf['prefix'], self.next_dirty_pass(tf), codes, fetch_config.DIRTY_TTL)
+            self.writer.submit(batch)
+
+    def update_derived(self, batch: WriteBatch, source_tf: dict, code: str, dirty: Dict[str, Set[str]]):
+        """
+        源周期更新后，合成由它派生的周期并加入写入批次（日K更新后会继续合成周K）
+
+        只合并不早于缓存最后一根的合成K线，更早的K线以启动时 OpenD 的数据为准；
+        只取合成周期倒数第二根之后的源K线来合成，不组装整个源序列
+
+        Args:
+            batch: 本轮的写入批次
+            source_tf: 源周期配置
+            code: 代码
+            dirty: 周期名称 -> 变化的代码，写入了的代码会加进去
+        """
+        for tf in self.derived_by_source.get(source_tf['name'], []):
+            recent = self.series_store.get(tf['ktype'], code, 2)
+            if recent is None or recent.empty:
+                continue
+            last_time = recent['DateTime'].iloc[-1]
+
+            since = recent['DateTime'].iloc[0] if len(recent) == 2 else None
+            source = self.series_store.get(source_tf['ktype'], code, since=since)
+            if source is None:
+                continue
+            bars = resample_bars(source, tf['ktype'], market_of(code))
+            bars = bars[bars['DateTime'] >= last_time]
+            if bars.empty:
+                continue
+
+            self.series_store.apply(tf['ktype'], code, bars, tf.get('keep', tf['x500']), confirm=False)
+            if self.write_series(batch, tf, code, bars):
+                dirty.setdefault(tf['name'], set()).add(code)
+                self.update_derived(batch, tf, code, dirty)
+
+    def mark_pending(self, ktype: str, code: str, first: pd.Timestamp):
+        """记下推送更新过的代码和最早变化的K线时间，由 flush_pushes 合并写入"""
+        with self.push_lock:
+            pending = self.push_pending.get((ktype, code))
+            self.push_pending[(ktype, code)] = first if pending is None else min(pending, first)
+
+    def on_kline_push(self, data: pd.DataFrame):
+        """
+        处理 CurKline 推送（运行在 futu 推送子线程中）：合并进内存序列，只记下变化的代码，由 flush_pushes 合并写入
+
+        Args:
+            data: futu 推送的原始数据框
+        """
+        for (ktype, code), bars in normalize_push(data).items():
+            tf = self.tf_by_ktype.get(ktype)
+            # 种子数据还没抓完之前的推送直接丢弃，抓取时会拿到完整窗口
+            if tf is None or not self.series_store.has(ktype, code):
+                continue
+
+            self.series_store.apply(ktype, code, bars, tf.get('keep', tf['x500']))
+            self.mark_pending(ktype, code, bars['DateTime'].min())
+
+    def on_tick_push(self, data: pd.DataFrame):
+        """
+        处理 QUOTE/TICKER 推送（运行在 futu 推送子线程中）：把成交合并进未收盘的 1 分钟K线，
+        只记下变化的代码，由 flush_pushes 合并写入
+
+        Args:
+            data: futu 推送的原始数据框
+        """
+        if self.tick_type == 'QUOTE':
+            ticks = ticks_from_quote(data, self.quote_volume)
+        else:
+            ticks = ticks_from_ticker(data)
+
+        ktype = self.tick_tf['ktype']
+        for code, bars in aggregate_ticks(ticks).items():
+            # 种子数据还没抓完的代码先不处理
+            first = self.series_store.merge_forming(ktype, code, bars)
+            if first is None:
+                continue
+            self.mark_pending(ktype, code, first)
+
+    def flush_pushes(self) -> int:
+        """
+        写入上次以来由 CurKline 推送、成交推送更新过的代码（以及由它们合成的周期），
+        整批一次提交，每个周期只发布一个变化轮次
+
+        Returns:
+            int: 内容有变化、提交写入的代码数量
+        """
+        with self.push_lock:
+            pending, self.push_pending = self.push_pending, {}
+        if not pending:
+            return 0
+
+        batch = WriteBatch()
+        dirty: Dict[str, Set[str]] = {}
+        for (ktype, code), first in pending.items():
+            tf = self.tf_by_ktype[ktype]
+            changed = self.series_store.get(ktype, code, since=first)
+            if changed is None:
+                continue
+            if self.write_series(batch, tf, code, changed):
+                dirty.setdefault(tf['name'], set()).add(code)
+                self.update_derived(batch, tf, code, dirty)
+
+        # 推送只发布确实有变化的周期
+        if dirty:
+            self.submit_dirty(batch, dirty)
+        return len(set().union(*dirty.values()))
+
+    def flush_pushes_loop(self, interval: float = fetch_config.PUSH_FLUSH_INTERVAL):
+        """写入线程：每隔 interval 秒合并写入一次推送更新，直到 close"""
+        while not self.push_stop.wait(interval):
+            try:
+                self.flush_pushes()
+            except Exception as e:
+                logger.error(f"写入推送更新失败: {e}")
+
+    def refresh_snapshot(self, tfs: List[dict], codes: List[str]) -> int:
+        """
+        用 get_market_snapshot 一次更新这些代码在这些周期的最后一根K线（见 fetch_config.TIMEFRAMES 的 snapshot）
+
+        Args:
+            tfs: 周期配置列表
+            codes: 代码列表（交易时段内的市场的代码，见 session_codes）
+
+        Returns:
+            int: 至少一个周期内容有变化、提交写入的代码数量
+        """
+        result = self.gateways.fetch_batches(codes, fetch_config.SNAPSHOT_BATCH,
+                                             lambda quote_ctx, codes: quote_ctx.get_market_snapshot(codes))
+        if result.failed:
+            logger.warning(f"快照 {len(result.failed)} 个代码请求失败: {set(result.failed.values())}")
+        if not result.ok:
+            return 0
+
+        data = pd.concat(list(result.ok.values()), ignore_index=True)
+        ticks = ticks_from_snapshot(data, self.quote_volume)
+
+        batch = WriteBatch()
+        dirty: Dict[str, Set[str]] = {tf['name']: set() for tf in tfs}
+        for tf in tfs:
+            ktype = tf['ktype']
+            frames = {}
+            if ktype == 'K_DAY':
+                for code, bars in day_bars_from_snapshot(data).items():
+                    if self.series_store.has(ktype, code):
+                        self.series_store.apply(ktype, code, bars, tf.get('keep', tf['x500']), confirm=False)
+                        frames[code] = bars
+            else:
+                for code, bars in aggregate_ticks(ticks, ktype).items():
+                    first = self.series_store.merge_forming(ktype, code, bars)
+                    if first is not None:
+                        frames[code] = self.series_store.get(ktype, code, since=first)
+
+            for code, changed in frames.items():
+                if self.write_series(batch, tf, code, changed):
+                    dirty[tf['name']].add(code)
+                    self.update_derived(batch, tf, code, dirty)
+        self.submit_dirty(batch, dirty)
+
+        return len(set().union(*(dirty[tf['name']] for tf in tfs)))
+
+    def bar_closed(self, tf: dict, now: float) -> bool:
+        """轮询周期上次刷新之后是否有K线收盘（收盘 BAR_CLOSE_DELAY 秒后才算）"""
+        delay = timedelta(seconds=fetch_config.BAR_CLOSE_DELAY)
+        boundary = last_boundary(tf['name'], datetime.fromtimestamp(now) - delay, self.markets)
+        return boundary is not None and self.last_refresh[tf['name']] < (boundary + delay).timestamp()
+
+    def is_due(self, tf: dict, now: float) -> bool:
+        """
+        判断某周期是否到了刷新时间
+
+        轮询周期在每根K线收盘 BAR_CLOSE_DELAY 秒后刷新一次；配置了 interval 时，
+        交易时段内再按 interval 刷新未收盘的K线；休市时不刷新
+        """
+        last = self.last_refresh.get(tf['name'])
+        if tf.get('mode', 'poll') in ('push', 'derived'):
+            # 推送、合成周期只需要启动时抓取一次；有代码种子抓取失败时再补抓
+            return last is None or any(not self.series_store.has(tf['ktype'], code)
+                                       for code in self.codelist)
+        if last is None:
+            return True
+
+        if self.bar_closed(tf, now):
+            return True
+
+        now_dt = datetime.fromtimestamp(now)
+        interval = tf.get('interval', 0)
+        return interval > 0 and in_session(now_dt, self.markets) and now - last >= interval
+
+    def session_codes(self, now: float) -> List[str]:
+        """在交易时段内的市场的代码（两次收盘之间只刷新这些代码，其它市场已收盘或在午休）"""
+        now_dt = datetime.fromtimestamp(now)
+        open_markets = {market for market in self.markets if in_session(now_dt, (market,))}
+        return [code for code in self.codelist if market_of(code) in open_markets]
+
+    def seconds_until_due(self, now: float) -> float:
+        """距离下一个轮询周期到期还有多少秒"""
+        delay = timedelta(seconds=fetch_config.BAR_CLOSE_DELAY)
+        now_dt = datetime.fromtimestamp(now)
+        waits = [fetch_config.IDLE_SLEEP_MAX]
+        if self.warmup_time is not None and self.warmed != now_dt.date() and now_dt.time() < self.warmup_time:
+            waits.append((datetime.combine(now_dt.date(), self.warmup_time) - now_dt).total_seconds())
+        for tf in self.timeframes:
+            if tf.get('mode', 'poll') != 'poll':
+                continue
+            waits.append((next_boundary(tf['name'], now_dt - delay, self.markets) + delay).timestamp() - now)
+            interval = tf.get('interval', 0)
+            last = self.last_refresh.get(tf['name'])
+            if interval > 0 and last is not None and in_session(now_dt, self.markets):
+                waits.append(last + interval - now)
+        return min(waits)
+
+    def load_history(self, tf: dict, codes: List[str]):
+        """
+        还没有缓存的代码从本地历史存储加载最近 keep 根K线作为缓存
+
+        Args:
+            tf: 周期配置
+            codes: 代码列表
+        """
+        keep = tf.get('keep', tf['x500'])
+        loaded = 0
+        for code in codes:
+            if self.series_store.has(tf['ktype'], code) or code in self.adjusted:
+                continue
+            try:
+                bars = self.history.load_tail(tf['name'], code, keep)
+            except Exception as e:
+                logger.error(f"{tf['name']} {code} 读取本地历史失败: {e}")
+                continue
+            if not bars.empty:
+                self.series_store.seed(tf['ktype'], code, bars, keep)
+                loaded += 1
+        if loaded:
+            logger.info(f"{tf['name']}: 从本地历史加载 {loaded} 个代码")
+
+    def fetch_timeframe(self, tf: dict, codes: Optional[List[str]] = None) -> int:
+        """
+        刷新一个周期，整个周期的写入作为一批交给后台写线程（事务写入，读取端不会看到一半新一半旧）
+
+        已有缓存的代码只抓最近 tail 根K线合并进缓存；没有缓存的代码先从本地历史存储加载，
+        仍然没有或尾部与缓存之间有缺口的代码完整抓取 keep（默认 x500）根
+
+        Args:
+            tf: 周期配置
+            codes: 轮询周期 interval 刷新时交易时段内、按活跃度选出的代码（见 session_codes、refresh_priority），
+                   None 为全部代码
+
+        Returns:
+            int: 内容有变化、提交写入的代码数量
+        """
+        ktype = tf['ktype']
+        scored = codes is not None
+        tail = tf.get('tail', 0)
+        keep = tf.get('keep', tf['x500'])
+
+        if tf.get('mode', 'poll') in ('push', 'derived'):
+            # 推送、合成周期只补抓还没有种子的代码
+            codes = [code for code in self.codelist if not self.series_store.has(ktype, code)]
+        elif codes is None:
+            codes = self.codelist
+
+        if self.history is not None and tail:
+            self.load_history(tf, codes)
+
+        cached = {code: self.series_store.has(ktype, code) for code in codes}
+        tail_codes = [code for code in codes if tail and cached[code]]
+        full_codes = [code for code in codes if not (tail and cached[code])]
+
+        # code -> 变化的K线（None 表示完整抓取）
+        frames = {}
+        failed = {}
+
+        result = self.gateways.fetch_all(
+            tail_codes,
+            lambda quote_ctx, code: quote_ctx.get_cur_kline(code, tail, ktype, AuType.QFQ))
+        failed.update(result.failed)
+        for code, data in normalize_klines(result.ok).items():
+            if has_gap(self.series_store.last_time(ktype, code), data):
+                full_codes.append(code)
+            elif not self.series_store.closed_bars_match(ktype, code, data):
+                self.invalidate_code(code, f"{tf['name']} 已收盘K线与缓存不一致")
+                full_codes.append(code)
+            else:
+                self.series_store.apply(ktype, code, data, keep)
+                frames[code] = data
+
+        result = self.gateways.fetch_all(
+            full_codes,
+            lambda quote_ctx, code: quote_ctx.get_cur_kline(code, keep, ktype, AuType.QFQ))
+        failed.update(result.failed)
+        for code, data in normalize_klines(result.ok).items():
+            self.series_store.seed(ktype, code, data, keep)
+            frames[code] = None
+
+        if failed:
+            # 失败的代码保留上一次写入的数据，下一轮重新抓取
+            logger.warning(f"{tf['name']} {len(failed)} 个代码抓取失败: {failed}")
+
+        batch = WriteBatch()
+        # 本周期每轮都发布（可能为空），合成周期只在有变化时发布
+        dirty: Dict[str, Set[str]] = {tf['name']: set()}
+        for code, changed in frames.items():
+            if self.write_series(batch, tf, code, changed):
+                dirty[tf['name']].add(code)
+                self.update_derived(batch, tf, code, dirty)
+        self.submit_dirty(batch, dirty)
+
+        if self.priority is not None and tf.get('mode', 'poll') == 'poll':
+            # 只有 interval 刷新计入活跃度，收盘刷新只更新刷新时间
+            self.priority.record(tf['name'], frames, dirty[tf['name']] if scored else None, time.time())
+
+        return len(dirty[tf['name']])
+
+    def invalidate_code(self, code: str, reason: str):
+        """
+        复权因子变化（前复权下除权除息会改写全部历史价格）：丢弃该代码所有周期的缓存和指纹，
+        本次运行中不再从本地历史加载它（本地历史文件保留，同样过时，由 backfill_history 发现后重新回补），
+        让所有周期重新完整抓取它；其它代码仍只抓尾部
+
+        Args:
+            code: 代码
+            reason: 日志中的原因
+        """
+        logger.warning(f"{code} {reason}，复权因子可能已变化，重建该代码的全部周期")
+        self.series_store.drop(code)
+        for tf in self.timeframes:
+            self.fingerprints.pop((tf['ktype'], code), None)
+        self.adjusted.add(code)
+        self.last_refresh.clear()
+
+    def check_adjustments(self):
+        """
+        每个交易日检查一次推送周期的复权变化：推送只带最新的K线，没有与缓存重叠的已收盘K线可以比较，
+        抓取一次尾部K线与缓存比对；轮询周期每次抓尾部时已经比对
+
+        除权除息在开盘前生效，前复权数据在盘前才更新：检查在交易日 WARMUP_TIME（盘前预热的那一轮，
+        关闭预热时为开盘时间）之后的第一轮进行，不在午夜之后立即进行
+        """
+        now = datetime.now()
+        if self.adjust_checked == now.date() or not is_trading_day(now.date(), self.markets) or \
+                now.time() < (self.warmup_time or session_open(self.markets)):
+            return
+        self.adjust_checked = now.date()
+
+        for tf in self.timeframes:
+            if tf.get('mode', 'poll') != 'push':
+                continue
+            ktype = tf['ktype']
+            tail = max(tf.get('tail', 0), 2)
+            codes = [code for code in self.codelist if self.series_store.has(ktype, code)]
+            if not codes:
+                # 刚启动时还没有缓存，本轮完整抓取的就是最新复权的数据
+                continue
+            result = self.gateways.fetch_all(
+                codes, lambda quote_ctx, code: quote_ctx.get_cur_kline(code, tail, ktype, AuType.QFQ))
+            changed = [code for code, data in normalize_klines(result.ok).items()
+                       if not self.series_store.closed_bars_match(ktype, code, data)]
+            for code in changed:
+                self.invalidate_code(code, f"{tf['name']} 已收盘K线与缓存不一致")
+            logger.info(f"{tf['name']} 复权检查: {len(result.ok)} 个代码，{len(changed)} 个需要重建，"
+                        f"{len(result.failed)} 个请求失败")
+
+    def run_pass(self):
+        """执行一轮抓取：刷新所有到期的周期"""
+        self.pass_count += 1
+        self.refresh_universe()
+        if not self.gateways.available():
+            return
+        self.check_adjustments()
+        snapshot_tfs = []
+        for tf in self.timeframes:
+            now = time.time()
+            if not self.is_due(tf, now):
+                continue
+            # 配置了 snapshot 的周期在两次收盘之间只用快照更新最后一根，所有这样的周期共用一次快照请求
+            if tf['name'] in self.snapshot_names and tf['name'] in self.last_refresh and \
+                    not self.bar_closed(tf, now):
+                snapshot_tfs.append(tf)
+                continue
+
+            # 两次收盘之间的 interval 刷新只抓交易时段内的市场中到了刷新间隔的代码，收盘刷新抓取全部代码
+            codes = None
+            if tf.get('mode', 'poll') == 'poll' and tf['name'] in self.last_refresh and not self.bar_closed(tf, now):
+                codes = self.session_codes(now)
+                if self.priority is not None:
+                    codes = self.priority.due(tf['name'], codes, tf.get('interval', 0), now)
+                if not codes:
+                    self.last_refresh[tf['name']] = now
+                    continue
+
+            start = time.time()
+            written = self.fetch_timeframe(tf, codes)
+            self.last_refresh[tf['name']] = now
+            fetched = len(self.codelist) if codes is None else len(codes)
+            logger.info(f"第 {self.pass_count} 轮 {tf['name']}: 写入 {written}/{fetched}，"
+                        f"耗时 {time.time() - start:.3f} 秒")
+
+        if snapshot_tfs:
+            now = time.time()
+            codes = self.session_codes(now)
+            written = self.refresh_snapshot(snapshot_tfs, codes)
+            for tf in snapshot_tfs:
+                self.last_refresh[tf['name']] = now
+            logger.info(f"第 {self.pass_count} 轮快照 {[tf['name'] for tf in snapshot_tfs]}: "
+                        f"写入 {written}/{len(codes)}，耗时 {time.time() - now:.3f} 秒")
+
+        self.log_writer_stats()
+
+    def check_connections(self) -> bool:
+        """
+        检查主 Redis、各副本 Redis 和 MQTT_CHECK 能否连通
+
+        Returns:
+            bool: 全部连通
+        """
+        ok = True
+        for name, pool in [('primary', self.redis_pool)] + list(self.replica_pools.items()):
+            try:
+                redis.Redis(connection_pool=pool).ping()
+            except redis.RedisError as e:
+                logger.error(f"Redis {name} 连接失败: {e}")
+                ok = False
+        if fetch_config.MQTT_CHECK is not None:
+            host, port = fetch_config.MQTT_CHECK
+            try:
+                socket.create_connection((host, port), timeout=5).close()
+            except OSError as e:
+                logger.error(f"MQTT {host}:{port} 连接失败: {e}")
+                ok = False
+        return ok
+
+    def warm_up(self):
+        """
+        盘前预热：检查连接，按代码池重新订阅，所有周期立即刷新一轮（没有缓存的代码从本地历史或 OpenD 完整加载，
+        合成周期一并写出，当天推送周期的复权检查也在这一轮完成，见 check_adjustments），
+        开盘后第一根K线收盘时只需抓尾部；
+        开盘前 QUOTE/快照的累计成交量基准置 0，第一根 1 分钟K线包含集合竞价的成交量
+        """
+        start = time.time()
+        now = datetime.now()
+        self.warmed = now.date()
+        connected = self.check_connections()
+
+        self.last_refresh.clear()
+        self.run_pass()
+        if now.time() < session_open(self.markets):
+            self.quote_volume.update(dict.fromkeys(self.codelist, 0))
+
+        cached = {tf['name']: sum(self.series_store.has(tf['ktype'], code) for code in self.codelist)
+                  for tf in self.timeframes}
+        logger.info(f"盘前预热完成，耗时 {time.time() - start:.3f} 秒，连接{'正常' if connected else '异常'}，"
+                    f"{len(self.codelist)} 个代码，各周期已缓存: {cached}")
+
+    def warm_up_due(self, now: float) -> bool:
+        """今天是交易日、到了 WARMUP_TIME 且今天还没有预热"""
+        now_dt = datetime.fromtimestamp(now)
+        return (self.warmup_time is not None and self.warmed != now_dt.date()
+                and is_trading_day(now_dt.date(), self.markets) and now_dt.time() >= self.warmup_time)
+
+    def log_writer_stats(self):
+        """
+        落后超过 REDIS_LAG_WARN 秒的 Redis 目标立即告警；每隔 REDIS_STATS_INTERVAL 秒输出一次写入统计，
+        以及这段时间编码的字节数、压缩比和 CPU 时间（见 bar_codec.codec_stats）
+        """
+        stats = self.writer.stats()
+        for s in stats:
+            if s['lag'] > fetch_config.REDIS_LAG_WARN:
+                logger.warning(f"Redis {s['name']} 落后 {s['lag']:.1f} 秒，积压 {s['queued']} 批，失败 {s['failures']} 次")
+        if time.time() - self.last_stats_log >= fetch_config.REDIS_STATS_INTERVAL:
+            self.last_stats_log = time.time()
+            logger.info(f"Redis 写入统计: {stats}")
+            logger.info(f"编码统计（最近 {fetch_config.REDIS_STATS_INTERVAL} 秒）: {codec_stats(reset=True)}")
+
+    def run_forever(self, loop_sleep: float = fetch_config.LOOP_SLEEP):
+        """
+        常驻循环，直到 Ctrl+C；每轮之后等到下一个周期到期，休市时空闲等待；每个交易日到 WARMUP_TIME 时做一次盘前预热
+
+        Args:
+            loop_sleep: 每轮之间的最短等待时间（秒）
+        """
+        try:
+            while True:
+                if self.warm_up_due(time.time()):
+                    self.warm_up()
+                else:
+                    self.run_pass()
+                time.sleep(max(loop_sleep, self.seconds_until_due(time.time())))
+        except KeyboardInterrupt:
+            logger.info(f"程序被用户中断，共执行 {self.pass_count} 轮")
+
+    def close(self):
+        """关闭行情连接和Redis连接池"""
+        self.gateways.close()
+        if self.push_thread is not None:
+            self.push_stop.set()
+            self.push_thread.join()
+            self.flush_pushes()
+        self.writer.close()
+        if self.shm is not None:
+            self.shm.close()
+        self.redis_pool.disconnect()
+        for pool in self.replica_pools.values():
+            pool.disconnect()
+
+
+def main():
+    """主函数"""
+    daemon = KlineFetchDaemon(UniverseRegistry.from_config(), fetch_config.TIMEFRAMES)
+
+    try:
+        if not daemon.connect():
+            return
+        daemon.run_forever()
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
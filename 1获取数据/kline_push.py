@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+K线推送模式
+订阅时 subscribe_push=True，由 CurKline 推送回调把新K线合并进内存序列，
+只重写发生变化的代码，不再每轮对全部代码轮询 get_cur_kline
+"""
+
+import logging
+from typing import Callable
+
+import pandas as pd
+
+try:
+    from moomoo import CurKlineHandlerBase, RET_OK
+except ImportError:
+    from futu import CurKlineHandlerBase, RET_OK
+
+logger = logging.getLogger(__name__)
+
+
+class PushCallbackMixin:
+    """
+    把收到的原始推送数据框交给 callback 处理，与 futu 的推送回调基类一起继承
+    （K线推送见 KlinePushHandler，成交推送见 tick_bars）
+    """
+
+    # 日志中的推送名称
+    push_name = '推送'
+
+    def __init__(self, callback: Callable[[pd.DataFrame], None]):
+        """
+        Args:
+            callback: 推送处理函数，参数为 futu 推送的原始数据框
+        """
+        super().__init__()
+        self.callback = callback
+
+    def on_recv_rsp(self, rsp_pb):
+        ret_code, data = super().on_recv_rsp(rsp_pb)
+        if ret_code != RET_OK:
+            logger.error(f"{self.push_name}错误: {data}")
+            return ret_code, data
+
+        try:
+            self.callback(data)
+        except Exception as e:
+            # 回调运行在 futu 的推送子线程中，异常不能抛出去
+            logger.error(f"处理{self.push_name}失败: {e}")
+
+        return RET_OK, data
+
+
+class KlinePushHandler(PushCallbackMixin, CurKlineHandlerBase):
+    """CurKline 推送回调，callback 的参数为原始K线数据框（含 code、k_type 列）"""
+
+    push_name = 'K线推送'
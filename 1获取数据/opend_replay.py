@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+OpenD 响应录制与回放
+RecordingQuoteContext 包装真实的行情连接，把订阅、get_cur_kline、快照、历史K线请求的响应和推送（CurKline、成交）追加写入录制文件；
+ReplayQuoteContext 不连接 OpenD，按录制文件返回响应，可以配置延迟和注入错误，
+用于在没有 OpenD 的机器上、休市时间确定性地测试和压测整条抓取链路
+
+录制文件是 pickle 流，每条记录为 {'t': 时间戳, 'method': 方法名, 'args': 参数, 'ret': 返回码, 'data': 数据}，
+只回放自己录制的文件
+
+用法: python opend_replay.py <录制文件> [轮数，默认 10]
+    用回放连接运行抓取服务若干轮（每轮所有周期都刷新），打印每轮耗时
+    K线仍写入 fetch_config 配置的 Redis，压测时应改用单独的 REDIS_DB
+"""
+
+import logging
+import pickle
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from moomoo import OpenQuoteContext, RET_OK, RET_ERROR
+except ImportError:
+    from futu import OpenQuoteContext, RET_OK, RET_ERROR
+
+import fetch_config
+
+logger = logging.getLogger(__name__)
+
+# 注入的错误信息，分别触发 fetch_engine 的限频重试、断线熔断和不重试的错误
+INJECTED_ERRORS = ['请求过于频繁，请稍后再试', '网络连接断开', '未知股票']
+
+
+def read_records(path: str) -> List[dict]:
+    """读取录制文件中的全部记录"""
+    records = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                records.append(pickle.load(f))
+            except EOFError:
+                return records
+
+
+class RecordingQuoteContext:
+    """包装真实行情连接，调用照常转发，同时把响应追加写入录制文件"""
+
+    def __init__(self, quote_ctx: OpenQuoteContext, path: str):
+        """
+        Args:
+            quote_ctx: 真实的行情连接
+            path: 录制文件路径（追加写入）
+        """
+        self.quote_ctx = quote_ctx
+        self.file = open(path, 'ab')
+        self.lock = threading.Lock()
+
+    def record(self, method: str, args: dict, ret: Any, data: Any):
+        with self.lock:
+            pickle.dump({'t': time.time(), 'method': method, 'args': args, 'ret': ret, 'data': data}, self.file)
+            self.file.flush()
+
+    def _call(self, method: str, args: dict) -> Tuple[int, Any]:
+        ret, data = getattr(self.quote_ctx, method)(**args)
+        self.record(method, args, ret, data)
+        return ret, data
+
+    def subscribe(self, code_list, subtype_list, subscribe_push=True):
+        return self._call('subscribe', {'code_list': list(code_list), 'subtype_list': list(subtype_list),
+                                        'subscribe_push': subscribe_push})
+
+    def unsubscribe(self, code_list, subtype_list):
+        return self._call('unsubscribe', {'code_list': list(code_list), 'subtype_list': list(subtype_list)})
+
+    def query_subscription(self, is_all_conn=True):
+        return self._call('query_subscription', {'is_all_conn': is_all_conn})
+
+    def get_cur_kline(self, code, num, ktype, autype):
+        return self._call('get_cur_kline', {'code': code, 'num': num, 'ktype': ktype, 'autype': autype})
+
+    def get_market_snapshot(self, code_list):
+        return self._call('get_market_snapshot', {'code_list': list(code_list)})
+
+    def request_history_kline(self, code, start=None, end=None, ktype=None, autype=None,
+                              max_count=None, page_req_key=None):
+        args = {'code': code, 'start': start, 'end': end, 'ktype': ktype, 'autype': autype,
+                'max_count': max_count, 'page_req_key': page_req_key}
+        ret, data, next_key = self.quote_ctx.request_history_kline(**args)
+        self.record('request_history_kline', args, ret, (data, next_key))
+        return ret, data, next_key
+
+    def set_handler(self, handler):
+        """推送处理器的 callback（见 kline_push.KlinePushHandler）收到数据时先录制，记下处理器类型"""
+        callback = getattr(handler, 'callback', None)
+        if callback is not None:
+            args = {'handler': type(handler).__name__}
+
+            def recording_callback(data: pd.DataFrame):
+                self.record('push', args, RET_OK, data)
+                callback(data)
+            handler.callback = recording_callback
+        return self.quote_ctx.set_handler(handler)
+
+    def close(self):
+        self.quote_ctx.close()
+        with self.lock:
+            self.file.close()
+
+
+class ReplayQuoteContext:
+    """按录制文件返回响应的行情连接，不需要 OpenD"""
+
+    def __init__(self, path: str, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = 0):
+        """
+        Args:
+            path: 录制文件路径
+            latency: 每次请求的固定延迟（秒）
+            jitter: 在固定延迟上再加 0~jitter 秒的随机延迟
+            error_rate: 每次请求返回注入错误的概率
+            seed: 随机数种子，相同种子的回放延迟和错误序列相同
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # 处理器类型名 -> 处理器
+        self.handlers: Dict[str, Any] = {}
+        self.subscribed: Dict[str, set] = {}
+
+        # (方法, 代码, K线类型) -> 按录制顺序的响应，以及下一次返回的位置
+        self.responses: Dict[Tuple[str, str, Any], List[Tuple[int, Any]]] = {}
+        self.cursors: Dict[Tuple[str, str, Any], int] = {}
+        self.pushes: List[Tuple[float, str, pd.DataFrame]] = []
+
+        for record in read_records(path):
+            method = record['method']
+            if method == 'push':
+                # 早期的录制只有 CurKline 推送，没有记录处理器类型
+                self.pushes.append((record['t'], record['args'].get('handler', 'KlinePushHandler'),
+                                    record['data']))
+            elif method in ('get_cur_kline', 'request_history_kline'):
+                key = (method, record['args']['code'], record['args']['ktype'])
+                self.responses.setdefault(key, []).append((record['ret'], record['data']))
+            elif method == 'get_market_snapshot' and record['ret'] == RET_OK:
+                # 按代码拆开，回放时请求的代码组合可以与录制时不同
+                for code, row in record['data'].groupby('code', sort=False):
+                    self.responses.setdefault((method, code, None), []).append((RET_OK, row))
+        logger.info(f"回放 {path}: {len(self.responses)} 组K线响应，{len(self.pushes)} 条推送")
+
+    def _delay_and_error(self) -> Optional[str]:
+        """模拟延迟，按概率返回注入的错误信息"""
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            error = self.random.choice(INJECTED_ERRORS) if self.random.random() < self.error_rate else None
+        if delay > 0:
+            time.sleep(delay)
+        return error
+
+    def _next(self, key: Tuple[str, str, Any]) -> Optional[Tuple[int, Any]]:
+        """按录制顺序取下一个响应，取完后一直返回最后一个"""
+        with self.lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return None
+            index = self.cursors.get(key, 0)
+            self.cursors[key] = min(index + 1, len(responses) - 1)
+            return responses[index]
+
+    def subscribe(self, code_list, subtype_list, subscribe_push=True):
+        for code in code_list:
+            self.subscribed.setdefault(code, set()).update(subtype_list)
+        return RET_OK, None
+
+    def unsubscribe(self, code_list, subtype_list):
+        for code in code_list:
+            self.subscribed.get(code, set()).difference_update(subtype_list)
+        return RET_OK, None
+
+    def query_subscription(self, is_all_conn=True):
+        used = sum(len(types) for types in self.subscribed.values())
+        return RET_OK, {'total_used': used, 'own_used': used, 'remain': fetch_config.REPLAY_QUOTA - used}
+
+    def get_cur_kline(self, code, num, ktype, autype):
+        error = self._delay_and_error()
+        if error is not None:
+            return RET_ERROR, error
+        response = self._next(('get_cur_kline', code, ktype))
+        if response is None:
+            return RET_ERROR, f"录制文件中没有 {code} {ktype} 的K线"
+        ret, data = response
+        # 录制时的根数可能与这次请求不同，只取最近 num 根
+        return ret, (data.tail(num).reset_index(drop=True) if ret == RET_OK else data)
+
+    def get_market_snapshot(self, code_list):
+        error = self._delay_and_error()
+        if error is not None:
+            return RET_ERROR, error
+        rows = [response[1] for response in (self._next(('get_market_snapshot', code, None))
+                                             for code in code_list) if response is not None]
+        if not rows:
+            return RET_ERROR, f"录制文件中没有 {len(code_list)} 个代码的快照"
+        return RET_OK, pd.concat(rows, ignore_index=True)
+
+    def request_history_kline(self, code, start=None, end=None, ktype=None, autype=None,
+                              max_count=None, page_req_key=None):
+        error = self._delay_and_error()
+        if error is not None:
+            return RET_ERROR, error, None
+        response = self._next(('request_history_kline', code, ktype))
+        if response is None:
+            return RET_ERROR, f"录制文件中没有 {code} {ktype} 的历史K线", None
+        ret, (data, next_key) = response
+        return ret, data, next_key
+
+    def set_handler(self, handler):
+        self.handlers[type(handler).__name__] = handler
+        return RET_OK
+
+    def play_pushes(self, speed: float = 1.0) -> threading.Thread:
+        """
+        在后台线程中按录制时的间隔（除以 speed）把推送交给同类型处理器的 callback
+
+        Args:
+            speed: 回放倍速，0 表示不等待、尽快推送
+
+        Returns:
+            threading.Thread: 回放线程
+        """
+        def run():
+            previous = None
+            for t, handler_name, data in self.pushes:
+                if previous is not None and speed > 0:
+                    time.sleep((t - previous) / speed)
+                previous = t
+                handler = self.handlers.get(handler_name)
+                if handler is not None:
+                    handler.callback(data)
+
+        thread = threading.Thread(target=run, name='push-replay', daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        pass
+
+
+def open_quote_context(host: str, port: int):
+    """
+    按 fetch_config 创建行情连接：配置了 OPEND_REPLAY 时回放，配置了 OPEND_RECORD 时录制，否则直接连接 OpenD
+
+    Args:
+        host: OpenD 地址
+        port: OpenD 端口
+
+    Returns:
+        行情连接（OpenQuoteContext 或接口相同的录制/回放连接）
+    """
+    if fetch_config.OPEND_REPLAY:
+        return ReplayQuoteContext(fetch_config.OPEND_REPLAY,
+                                  latency=fetch_config.REPLAY_LATENCY,
+                                  jitter=fetch_config.REPLAY_JITTER,
+                                  error_rate=fetch_config.REPLAY_ERROR_RATE,
+                                  seed=fetch_config.REPLAY_SEED)
+    quote_ctx = OpenQuoteContext(host=host, port=port)
+    if fetch_config.OPEND_RECORD:
+        return RecordingQuoteContext(quote_ctx, fetch_config.OPEND_RECORD)
+    return quote_ctx
+
+
+def main():
+    """用回放连接运行抓取服务若干轮，打印每轮耗时"""
+    from kline_daemon import KlineFetchDaemon
+    from universe import UniverseRegistry
+
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    fetch_config.OPEND_REPLAY = sys.argv[1]
+    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    daemon = KlineFetchDaemon(UniverseRegistry.from_config(), fetch_config.TIMEFRAMES)
+    try:
+        if not daemon.connect():
+            return
+        durations = []
+        for _ in range(passes):
+            # 每轮都刷新所有周期，不受收盘时间影响
+            daemon.last_refresh.clear()
+            start = time.perf_counter()
+            daemon.run_pass()
+            durations.append(time.perf_counter() - start)
+        durations.sort()
+        print(f"{passes} 轮: 最短 {durations[0]:.3f} 秒，中位 {durations[len(durations) // 2]:.3f} 秒，"
+              f"最长 {durations[-1]:.3f} 秒")
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    main()
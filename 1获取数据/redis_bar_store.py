@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+按K线时间索引的 Redis 存储
+每个代码每个周期一个有序集合，score 为K线时间戳（秒），member 为该K线的一行 CSV，
+写入方可以只更新一根K线，读取方可以只取最近 N 根或某时间之后的K线
+原来整块 CSV 的键继续保留，两种格式并存
+"""
+
+import io
+from typing import List, Optional
+
+import pandas as pd
+import redis
+
+from bar_codec import BAR_COLUMNS
+
+
+def bar_timestamps(bars: pd.DataFrame) -> List[int]:
+    """
+    K线时间转为整数秒，作为有序集合的 score
+
+    Args:
+        bars: 含 DateTime 列的数据框
+
+    Returns:
+        List[int]: 每根K线的时间戳（秒）
+    """
+    return ((bars['DateTime'] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).tolist()
+
+
+def to_timestamp(value) -> int:
+    """把时间（字符串、datetime 或 Timestamp）转为整数秒"""
+    return (pd.Timestamp(value) - pd.Timestamp(0)) // pd.Timedelta(seconds=1)
+
+
+def bars_to_members(bars: pd.DataFrame) -> List[str]:
+    """每根K线转为一行不带表头的 CSV"""
+    return bars[BAR_COLUMNS].to_csv(index=False, header=False).splitlines()
+
+
+def members_to_frame(members: list) -> pd.DataFrame:
+    """
+    有序集合的 member 列表还原为数据框
+
+    Args:
+        members: ZRANGE 返回的列表（bytes 或 str）
+
+    Returns:
+        pandas.DataFrame: 按 DateTime 升序的数据框，没有数据时返回空数据框
+    """
+    if not members:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    lines = [m.decode('utf-8') if isinstance(m, bytes) else m for m in members]
+    df = pd.read_csv(io.StringIO('\n'.join(lines)), names=BAR_COLUMNS, header=None)
+    df['DateTime'] = pd.to_datetime(df['DateTime'])
+    return df
+
+
+def upsert_bars(pipe: redis.client.Pipeline, key_name: str, bars: pd.DataFrame, max_bars: int):
+    """
+    插入或替换若干根K线（同一时间的旧K线先删除），并只保留最近 max_bars 根
+    命令只加入 pipeline，由调用方以事务方式执行
+
+    Args:
+        pipe: Redis pipeline
+        key_name: 有序集合键名
+        bars: 要写入的K线
+        max_bars: 最多保留的K线根数
+    """
+    for ts, member in zip(bar_timestamps(bars), bars_to_members(bars)):
+        pipe.zremrangebyscore(key_name, ts, ts)
+        pipe.zadd(key_name, {member: ts})
+    pipe.zremrangebyrank(key_name, 0, -(max_bars + 1))
+
+
+def replace_bars(pipe: redis.client.Pipeline, key_name: str, bars: pd.DataFrame):
+    """
+    用完整序列整体替换有序集合
+    命令只加入 pipeline，由调用方以事务方式执行
+
+    Args:
+        pipe: Redis pipeline
+        key_name: 有序集合键名
+        bars: 完整K线序列
+    """
+    pipe.delete(key_name)
+    if not bars.empty:
+        pipe.zadd(key_name, dict(zip(bars_to_members(bars), bar_timestamps(bars))))
+
+
+def read_last_bars(r: redis.Redis, key_name: str, n: int) -> pd.DataFrame:
+    """
+    读取最近 n 根K线
+
+    Args:
+        r: Redis客户端
+        key_name: 有序集合键名
+        n: K线根数
+
+    Returns:
+        pandas.DataFrame: 按 DateTime 升序的数据框
+    """
+    return members_to_frame(r.zrange(key_name, -n, -1))
+
+
+def read_bars_since(r: redis.Redis, key_name: str, since, until: Optional[object] = None) -> pd.DataFrame:
+    """
+    读取某时间（含）之后的K线
+
+    Args:
+        r: Redis客户端
+        key_name: 有序集合键名
+        since: 起始时间
+        until: 结束时间（含），默认到最新
+
+    Returns:
+        pandas.DataFrame: 按 DateTime 升序的数据框
+    """
+    max_score = '+inf' if until is None else to_timestamp(until)
+    return members_to_frame(r.zrangebyscore(key_name, to_timestamp(since), max_score))
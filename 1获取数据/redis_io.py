@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+K线数据写入 Redis 的公共函数
+"""
+
+import json
+from typing import Dict, List, Optional, Set, Tuple
+
+import redis
+import pandas as pd
+
+from bar_codec import CODEC_CSV, encode_frame
+
+# 下游落后超过这么多轮时不再逐轮读取变化列表，直接全部重算；积压合并的多轮也最多补写这么多轮
+DIRTY_MAX_PASSES = 1000
+
+
+def create_redis_pool(host: str, port: int = 6379, db: int = 0) -> redis.ConnectionPool:
+    """
+    创建Redis连接池（应在进程内只初始化一次）
+
+    Args:
+        host: Redis服务器地址
+        port: Redis端口
+        db: Redis数据库编号
+
+    Returns:
+        redis.ConnectionPool: 连接池
+    """
+    return redis.ConnectionPool(host=host, port=port, db=db)
+
+
+def pandas_to_redis(r: redis.Redis, key_name: str, dfx: pd.DataFrame, codec: str = CODEC_CSV,
+                    compression: Optional[str] = None, level: Optional[int] = None,
+                    cache: Optional[dict] = None):
+    """
+    将 DataFrame 序列化后写入 Redis
+
+    Args:
+        r: Redis客户端
+        key_name: Redis键名
+        dfx: 要写入的数据框
+        codec: 序列化格式，'csv' 或 'npy'，见 bar_codec
+        compression: 压缩方式，None、'lz4' 或 'zstd'，见 bar_codec
+        level: 压缩级别，None 为默认级别
+        cache: 传入同一个字典的多次调用只编码一次（同一批写入复制到多个 Redis 时）
+    """
+    payload = None if cache is None else cache.get('payload')
+    if payload is None:
+        payload = encode_frame(dfx, codec, compression, level)
+        if cache is not None:
+            cache['payload'] = payload
+    r.set(key_name, payload)
+
+
+def publish_dirty(pipe: redis.client.Pipeline, prefix: str, pass_no: int, codes: List[str], ttl: int,
+                  first_pass: Optional[int] = None):
+    """
+    发布一轮中K线有变化的代码（命令只加入 pipeline，与本轮的K线写入在同一个事务里）
+
+        <prefix>dirty:<轮次>  本轮变化的代码列表（JSON），ttl 秒后过期
+        <prefix>pass          最新轮次，单调递增
+        频道 <prefix>dirty    {"pass": 轮次, "codes": [...]}
+
+    Args:
+        pipe: Redis pipeline
+        prefix: 周期的键前缀，如 'BY54_1K_'
+        pass_no: 轮次
+        codes: 变化的代码
+        ttl: 变化列表的保留时间（秒）
+        first_pass: 积压时合并的多轮（见 redis_writer.WriteBatch.put_dirty）中最早的轮次，
+                    first_pass 到 pass_no 的每一轮（最多最近 DIRTY_MAX_PASSES 轮）都写入合并后的代码，
+                    下游逐轮读取时不会缺轮次；落后更多的下游读到缺失的轮次，全部重算
+    """
+    message = json.dumps({'pass': pass_no, 'codes': codes})
+    value = json.dumps(codes)
+    first = pass_no if first_pass is None else max(first_pass, pass_no - DIRTY_MAX_PASSES + 1)
+    for n in range(first, pass_no + 1):
+        pipe.set(f'{prefix}dirty:{n}', value, ex=ttl)
+    pipe.set(f'{prefix}pass', pass_no)
+    pipe.publish(f'{prefix}dirty', message)
+
+
+def publish_universe(pipe: redis.client.Pipeline, prefix: str, name: str, codes: List[str]):
+    """
+    写出一个代码池的成员集合 <prefix><名称>（命令只加入 pipeline）；各代码池共用周期的键，下游按成员集合取自己的代码
+
+    Args:
+        pipe: Redis pipeline
+        prefix: 代码池键前缀，如 'BY54_UNIVERSE_'
+        name: 代码池名称
+        codes: 成员代码；为空时删除集合（代码池已停用或没有订阅成功的代码）
+    """
+    pipe.delete(f'{prefix}{name}')
+    if codes:
+        pipe.sadd(f'{prefix}{name}', *codes)
+
+
+def publish_active_universes(pipe: redis.client.Pipeline, prefix: str, names: List[str]):
+    """
+    写出启用的代码池名称列表 <prefix>active（JSON，命令只加入 pipeline）
+
+    Args:
+        pipe: Redis pipeline
+        prefix: 代码池键前缀
+        names: 启用的代码池名称
+    """
+    pipe.set(f'{prefix}active', json.dumps(list(names)))
+
+
+def read_dirty_codes(r: redis.Redis, prefix: str, last_pass: int,
+                     max_passes: int = DIRTY_MAX_PASSES) -> Tuple[int, Optional[Set[str]]]:
+    """
+    读取 last_pass 之后各轮变化过的代码，供下游只重算有变化的代码
+
+    Args:
+        r: Redis客户端
+        prefix: 周期的键前缀
+        last_pass: 下游上次处理到的轮次
+        max_passes: 落后超过这么多轮时不再逐轮读取
+
+    Returns:
+        tuple: (最新轮次, 变化过的代码)；中间有轮次已过期或落后太多时代码为 None，表示需要全部重算
+    """
+    current = int(r.get(f'{prefix}pass') or 0)
+    if current <= last_pass:
+        return current, set()
+    if current - last_pass > max_passes:
+        return current, None
+
+    values = r.mget([f'{prefix}dirty:{n}' for n in range(last_pass + 1, current + 1)])
+    if any(value is None for value in values):
+        return current, None
+
+    codes = set()
+    for value in values:
+        codes.update(json.loads(value))
+    return current, codes
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+后台批量写 Redis
+抓取线程把一轮的写操作收集为一个 WriteBatch 提交，后台线程用一个 MULTI/EXEC pipeline 整批写入，
+抓取与写入并行；积压时多轮合并，同一个键只保留最新的整体写入，同一周期的变化轮次合并为一项
+RedisFanoutWriter 把每批写入复制到多个 Redis，每个目标一个后台线程，慢的目标不拖慢其它目标
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from redis_io import publish_dirty
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBatch:
+    """
+    一轮的写操作，按键分组
+
+    每个操作是一个 fn(pipe) 回调；replace=True 表示该操作整体覆盖这个键（SET、整体替换有序集合），
+    之前排队的同键操作会被丢弃；replace=False 表示增量操作（更新几根K线），按顺序保留；
+    增量操作可以带一个等价的整体写入 full，同键已有排队的操作时改用它，积压时每个键最多保留一个操作
+
+    变化轮次（见 redis_io.publish_dirty）单独记录，在K线写入之后发布；每轮的 dirty:<轮次> 键各不相同，
+    积压时同一周期的多轮合并为一项（代码取并集、轮次取范围），积压批次的大小不随轮数增长
+    """
+
+    def __init__(self):
+        self.ops: "OrderedDict[str, List[Tuple[Callable, bool, Optional[Callable]]]]" = OrderedDict()
+        # 周期键前缀 -> (最早轮次, 最新轮次, 变化的代码, ttl)
+        self.dirty: Dict[str, Tuple[int, int, frozenset, int]] = {}
+        # 批次中最早的写操作的提交时间，用于计算写入延迟
+        self.created = time.time()
+
+    def put(self, key_name: str, fn: Callable[[redis.client.Pipeline], None], replace: bool = True,
+            full: Optional[Callable[[redis.client.Pipeline], None]] = None):
+        """
+        加入一个写操作
+
+        Args:
+            key_name: Redis键名
+            fn: 把命令加入 pipeline 的回调
+            replace: 是否整体覆盖该键
+            full: 增量操作之后该键完整内容的整体写入（如 replace_bars 最新序列），None 表示没有
+        """
+        if replace or key_name not in self.ops:
+            self.ops[key_name] = [(fn, replace, full)]
+        elif full is not None:
+            # 同键已有排队的操作：这次的整体写入已包含之前的全部增量
+            self.ops[key_name] = [(full, True, None)]
+        else:
+            self.ops[key_name].append((fn, replace, full))
+        self.ops.move_to_end(key_name)
+
+    def put_dirty(self, prefix: str, pass_no: int, codes: Iterable[str], ttl: int, first_pass: Optional[int] = None):
+        """
+        加入一个周期的变化轮次；已有同周期的轮次时合并（代码取并集，轮次范围扩展到 first_pass..pass_no）
+
+        Args:
+            prefix: 周期的键前缀
+            pass_no: 轮次
+            codes: 变化的代码
+            ttl: 变化列表的保留时间（秒）
+            first_pass: 已合并的多轮中最早的轮次，None 表示只有 pass_no 一轮
+        """
+        first = pass_no if first_pass is None else first_pass
+        codes = frozenset(codes)
+        if prefix in self.dirty:
+            old_first, old_last, old_codes, _ = self.dirty[prefix]
+            first, pass_no, codes = min(first, old_first), max(pass_no, old_last), codes | old_codes
+        self.dirty[prefix] = (first, pass_no, codes, ttl)
+
+    def merge(self, newer: "WriteBatch"):
+        """把较新的一批合并进来（同键整体写入以新的为准，多个增量合并为一次整体写入，同周期的变化轮次合并）"""
+        for key_name, entries in newer.ops.items():
+            for fn, replace, full in entries:
+                self.put(key_name, fn, replace, full)
+        for prefix, (first, last, codes, ttl) in newer.dirty.items():
+            self.put_dirty(prefix, last, codes, ttl, first)
+        self.created = min(self.created, newer.created)
+
+    def copy(self) -> "WriteBatch":
+        """复制一份（写操作回调共用），交给另一个写线程后各自合并互不影响"""
+        batch = WriteBatch()
+        batch.ops = OrderedDict((key_name, list(entries)) for key_name, entries in self.ops.items())
+        batch.dirty = dict(self.dirty)
+        batch.created = self.created
+        return batch
+
+    def apply(self, pipe: redis.client.Pipeline):
+        """把全部写操作加入 pipeline：先写K线等各键，再发布变化轮次"""
+        for entries in self.ops.values():
+            for fn, _, _ in entries:
+                fn(pipe)
+        for prefix, (first, last, codes, ttl) in self.dirty.items():
+            publish_dirty(pipe, prefix, last, sorted(codes), ttl, first_pass=first)
+
+    def __len__(self):
+        return len(self.ops) + len(self.dirty)
+
+
+class RedisBulkWriter:
+    """后台线程批量写入 Redis，每次写入是一个事务，读取端不会看到写了一半的一轮"""
+
+    def __init__(self, pool: redis.ConnectionPool, max_pending: int = 8, retry_interval: float = 1.0,
+                 block: bool = True, name: str = 'RedisBulkWriter'):
+        """
+        Args:
+            pool: Redis连接池
+            max_pending: 排队等待写入的批次上限
+            retry_interval: 写入失败后的重试间隔（秒）
+            block: 队列满时 submit 是否阻塞（背压）；False 时合并进一个积压批次，提交方从不等待
+            name: 写线程名称，用于日志和统计
+        """
+        self.pool = pool
+        self.retry_interval = retry_interval
+        self.block = block
+        self.name = name
+        self._queue: "queue.Queue[Optional[WriteBatch]]" = queue.Queue(maxsize=max_pending)
+        # 不阻塞模式下队列满后到达的批次，比队列中的都新
+        self._overflow: Optional[WriteBatch] = None
+        self._overflow_lock = threading.Lock()
+
+        # 统计：正在写入的批次最早的提交时间、上一次写入完成时数据的延迟、写入和失败次数
+        self._inflight_since: Optional[float] = None
+        self.last_lag = 0.0
+        self.writes = 0
+        self.failures = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, batch: WriteBatch):
+        """提交一批写操作（阻塞模式下队列满时等待）"""
+        if not len(batch):
+            return
+        if self.block:
+            self._queue.put(batch)
+            return
+        with self._overflow_lock:
+            if self._overflow is None:
+                try:
+                    self._queue.put_nowait(batch)
+                    return
+                except queue.Full:
+                    self._overflow = WriteBatch()
+            self._overflow.merge(batch)
+
+    def _drain(self, batch: WriteBatch) -> Tuple[WriteBatch, bool]:
+        """把队列里已经到达的批次（以及积压批次）全部合并进来，返回 (合并后的批次, 是否收到结束标记)"""
+        while True:
+            try:
+                newer = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if newer is None:
+                return batch, True
+            batch.merge(newer)
+        with self._overflow_lock:
+            if self._overflow is not None:
+                batch.merge(self._overflow)
+                self._overflow = None
+        return batch, False
+
+    def lag(self) -> float:
+        """当前落后的秒数：还没写入的数据（正在写入、排队和积压的批次）中最早的提交距今多久，没有积压时为 0"""
+        created = [] if self._inflight_since is None else [self._inflight_since]
+        with self._queue.mutex:
+            created.extend(batch.created for batch in self._queue.queue if batch is not None)
+        with self._overflow_lock:
+            if self._overflow is not None:
+                created.append(self._overflow.created)
+        return time.time() - min(created) if created else 0.0
+
+    def stats(self) -> Dict[str, object]:
+        """写入统计"""
+        return {'name': self.name, 'lag': round(self.lag(), 3), 'last_lag': round(self.last_lag, 3),
+                'queued': self._queue.qsize() + (self._overflow is not None),
+                'writes': self.writes, 'failures': self.failures}
+
+    def _flush(self, batch: WriteBatch):
+        r = redis.Redis(connection_pool=self.pool)
+        pipe = r.pipeline(transaction=True)
+        batch.apply(pipe)
+        pipe.execute()
+
+    def _run(self):
+        pending: Optional[WriteBatch] = None
+        stop = False
+        while not (stop and pending is None):
+            if pending is None:
+                pending = self._queue.get()
+                if pending is None:
+                    stop = True
+                    continue
+
+            pending, stopped = self._drain(pending)
+            stop = stop or stopped
+            self._inflight_since = pending.created
+
+            try:
+                start = time.time()
+                self._flush(pending)
+                logger.debug(f"{self.name} 批量写入 {len(pending)} 个键，耗时 {time.time() - start:.3f} 秒")
+                self.last_lag = time.time() - pending.created
+                self.writes += 1
+                self._inflight_since = None
+                pending = None
+            except Exception as e:
+                self.failures += 1
+                if stop:
+                    logger.error(f"{self.name} 批量写入失败，退出时放弃 {len(pending)} 个键: {e}")
+                    return
+                logger.error(f"{self.name} 批量写入失败，{self.retry_interval} 秒后重试: {e}")
+                time.sleep(self.retry_interval)
+
+    def close(self, timeout: float = 10.0):
+        """写完排队的数据后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class RedisFanoutWriter:
+    """
+    把每批写入复制到多个 Redis：主 Redis 保持背压（写不过来时抓取等待），
+    其它目标各自一个不阻塞的写线程，慢或连不上时只在自己的积压批次里合并，不影响主 Redis 和抓取
+    """
+
+    def __init__(self, primary: redis.ConnectionPool, replicas: Dict[str, redis.ConnectionPool],
+                 max_pending: int = 8):
+        """
+        Args:
+            primary: 主 Redis 连接池
+            replicas: 目标名称 -> 其它 Redis 的连接池
+            max_pending: 每个目标排队等待写入的批次上限
+        """
+        self.writers = [RedisBulkWriter(primary, max_pending=max_pending, name='primary')]
+        for name, pool in replicas.items():
+            self.writers.append(RedisBulkWriter(pool, max_pending=max_pending, block=False, name=name))
+
+    def submit(self, batch: WriteBatch):
+        """提交一批写操作，先交给不阻塞的目标，最后交给主 Redis（队列满时等待）"""
+        if not len(batch):
+            return
+        for writer in self.writers[1:]:
+            writer.submit(batch.copy())
+        self.writers[0].submit(batch)
+
+    def stats(self) -> List[Dict[str, object]]:
+        """各目标的写入统计"""
+        return [writer.stats() for writer in self.writers]
+
+    def close(self, timeout: float = 10.0):
+        """各目标写完排队的数据后停止（每个目标最多等待 timeout 秒）"""
+        for writer in self.writers:
+            writer.close(timeout)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+按活跃度分配轮询刷新
+轮询周期两次收盘之间按 interval 刷新未收盘K线时，不再每轮抓取全部代码：每个代码记一个活跃度
+（最近几次刷新K线是否有变化的指数平均），活跃的代码每轮都抓，冷门代码按活跃度拉长刷新间隔，
+但最长不超过 MAX_STALENESS 秒；收盘刷新仍抓取全部代码
+
+刷新间隔 = interval + (MAX_STALENESS - interval) * (1 - 活跃度 / ACTIVITY_HOT)，活跃度不低于 ACTIVITY_HOT 时为 interval
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class RefreshPriority:
+    """各周期各代码的活跃度和上次刷新时间（只在主循环中使用）"""
+
+    def __init__(self, max_staleness: float, alpha: float, hot: float):
+        """
+        Args:
+            max_staleness: 冷门代码最长的刷新间隔（秒）
+            alpha: 活跃度的指数平均系数
+            hot: 活跃度不低于此值的代码每轮都刷新
+        """
+        self.max_staleness = max_staleness
+        self.alpha = alpha
+        self.hot = hot
+        # (周期名称, 代码) -> 活跃度、上次刷新时间；没有记录的代码视为活跃，每轮都刷新
+        self.score: Dict[Tuple[str, str], float] = {}
+        self.last: Dict[Tuple[str, str], float] = {}
+
+    def period(self, tf_name: str, code: str, interval: float) -> float:
+        """某代码当前的刷新间隔（秒）"""
+        score = self.score.get((tf_name, code), 1.0)
+        if score >= self.hot:
+            return interval
+        return interval + (max(self.max_staleness, interval) - interval) * (1 - score / self.hot)
+
+    def due(self, tf_name: str, codes: List[str], interval: float, now: float) -> List[str]:
+        """
+        本轮 interval 刷新需要抓取的代码
+
+        Args:
+            tf_name: 周期名称
+            codes: 全部代码
+            interval: 周期配置的 interval（秒）
+            now: 当前时间戳
+
+        Returns:
+            List[str]: 到了刷新间隔的代码（保持 codes 的顺序）
+        """
+        # 留出一轮调度的余量，刷新间隔等于 interval 的代码不会因为差几毫秒被推迟一轮
+        slack = min(interval, 1.0) / 2
+        return [code for code in codes
+                if now - self.last.get((tf_name, code), 0.0) + slack >= self.period(tf_name, code, interval)]
+
+    def record(self, tf_name: str, codes: Iterable[str], changed: Optional[Set[str]], now: float):
+        """
+        记录一次刷新的结果
+
+        Args:
+            tf_name: 周期名称
+            codes: 本次抓取成功的代码
+            changed: 其中K线有变化（价格或成交量）的代码；收盘刷新时为 None，
+                     新K线人人都有，只更新刷新时间、不计入活跃度
+            now: 抓取时间戳
+        """
+        for code in codes:
+            key = (tf_name, code)
+            self.last[key] = now
+            if changed is not None:
+                sample = 1.0 if code in changed else 0.0
+                self.score[key] = (1 - self.alpha) * self.score.get(key, 1.0) + self.alpha * sample
+
+    def drop(self, code: str):
+        """删除某代码的记录（代码移出代码池时）"""
+        for key in [key for key in self.last if key[1] == code]:
+            del self.last[key]
+            self.score.pop(key, None)
+
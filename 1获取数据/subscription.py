@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+增量订阅管理
+记录当前连接已订阅的 (代码, K线类型)，代码池变化时只订阅新增、反订阅移除的代码，不重新订阅整个列表
+OpenD 的订阅额度按 代码 × 类型 计算，订阅前检查剩余额度；订阅不满一分钟的代码不能反订阅，留到之后再反订阅
+"""
+
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    from moomoo import OpenQuoteContext, RET_OK
+except ImportError:
+    from futu import OpenQuoteContext, RET_OK
+
+logger = logging.getLogger(__name__)
+
+# OpenD 要求订阅至少一分钟后才能反订阅
+MIN_SUBSCRIBE_SECONDS = 60
+
+
+class SubscriptionManager:
+    """一个行情连接上的订阅状态"""
+
+    def __init__(self, quote_ctx: OpenQuoteContext, poll_types: List[str], push_types: List[str]):
+        """
+        Args:
+            quote_ctx: 行情连接
+            poll_types: 只订阅、不推送给脚本的K线类型（subscribe_push=False）
+            push_types: 需要推送给脚本的K线类型
+        """
+        self.quote_ctx = quote_ctx
+        self.poll_types = poll_types
+        self.push_types = push_types
+        # 已订阅的代码 -> 订阅时间
+        self.subscribed: Dict[str, float] = {}
+        # 额度：OpenD 返回的剩余额度，None 表示还没有查询过
+        self.remain: Optional[int] = None
+        self.own_used = 0
+
+    @property
+    def types_per_code(self) -> int:
+        """每个代码占用的订阅额度"""
+        return len(self.poll_types) + len(self.push_types)
+
+    def refresh_quota(self):
+        """向 OpenD 查询订阅额度"""
+        ret, data = self.quote_ctx.query_subscription(is_all_conn=True)
+        if ret != RET_OK:
+            logger.warning(f"查询订阅额度失败: {data}")
+            return
+        self.remain = data['remain']
+        self.own_used = data['own_used']
+
+    def _subscribe(self, codes: List[str]) -> bool:
+        for subtype_list, subscribe_push in ((self.poll_types, False), (self.push_types, True)):
+            if not subtype_list:
+                continue
+            ret, err_message = self.quote_ctx.subscribe(codes, subtype_list, subscribe_push=subscribe_push)
+            if ret != RET_OK:
+                logger.error(f"订阅 {len(codes)} 个代码失败: {err_message}")
+                return False
+        return True
+
+    def sync(self, codes: List[str]) -> Tuple[List[str], List[str]]:
+        """
+        使订阅与代码列表一致：只订阅新增的代码，反订阅已订阅一分钟以上的多余代码
+
+        额度不够时按列表顺序订阅放得下的代码，其余留到额度释放后的下一次 sync
+
+        Args:
+            codes: 需要订阅的代码（futu 格式）
+
+        Returns:
+            tuple: (本次订阅的代码, 本次反订阅的代码)
+        """
+        wanted: Set[str] = set(codes)
+        now = time.time()
+
+        removed = [code for code, since in self.subscribed.items()
+                   if code not in wanted and now - since >= MIN_SUBSCRIBE_SECONDS]
+        if removed:
+            ret, err_message = self.quote_ctx.unsubscribe(removed, self.poll_types + self.push_types)
+            if ret == RET_OK:
+                for code in removed:
+                    del self.subscribed[code]
+            else:
+                logger.warning(f"反订阅 {len(removed)} 个代码失败: {err_message}")
+                removed = []
+
+        added = [code for code in codes if code not in self.subscribed]
+        if added:
+            self.refresh_quota()
+            if self.remain is not None:
+                fit = self.remain // max(self.types_per_code, 1)
+                if fit < len(added):
+                    logger.error(f"订阅额度不足: 剩余 {self.remain}，新增 {len(added)} 个代码需要 "
+                                 f"{len(added) * self.types_per_code}，本次只订阅 {fit} 个")
+                    added = added[:fit]
+            if added and self._subscribe(added):
+                for code in added:
+                    self.subscribed[code] = now
+            else:
+                added = []
+
+        if added or removed:
+            self.refresh_quota()
+            logger.info(f"订阅变化: 新增 {len(added)}，移除 {len(removed)}，当前 {len(self.subscribed)} 个代码，"
+                        f"本连接占用额度 {self.own_used}，剩余 {self.remain}")
+        return added, removed
+
+    def pending(self, codes: List[str]) -> bool:
+        """是否还有没订阅上或没反订阅掉的代码"""
+        return set(codes) != set(self.subscribed)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+生成计算端（2计算技术指标/）使用的模块副本
+两个目录各自独立运行、互不导入，抓取端和计算端共用的格式模块以本目录的文件为准，
+副本由本脚本生成，只有说明副本来源的那一行不同
+
+运行: python sync_copies.py           重新生成全部副本
+      python sync_copies.py --check   只检查副本是否与原文件一致，不一致时退出码为 1
+"""
+
+import argparse
+import os
+import sys
+from typing import List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+COPY_DIR = os.path.join(os.path.dirname(HERE), '2计算技术指标')
+
+# 有副本的模块
+COPIES = ['bar_codec.py', 'bar_shm.py']
+
+
+def source_line(name: str) -> str:
+    """原文件中说明副本位置的一行"""
+    return f"2计算技术指标/{name} 由 1获取数据/sync_copies.py 从本文件生成，修改本文件后运行 python sync_copies.py"
+
+
+def copy_line(name: str) -> str:
+    """副本中说明来源的一行"""
+    return f"本文件由 1获取数据/sync_copies.py 从 1获取数据/{name} 生成，不要直接修改"
+
+
+def render_copy(name: str) -> str:
+    """由原文件生成副本的内容"""
+    with open(os.path.join(HERE, name), encoding='utf-8') as f:
+        text = f.read()
+    if text.count(source_line(name)) != 1:
+        raise ValueError(f"{name} 中找不到说明副本的一行: {source_line(name)}")
+    return text.replace(source_line(name), copy_line(name))
+
+
+def stale_copies() -> List[str]:
+    """与原文件不一致（或不存在）的副本"""
+    stale = []
+    for name in COPIES:
+        path = os.path.join(COPY_DIR, name)
+        current = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                current = f.read()
+        if current != render_copy(name):
+            stale.append(name)
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成计算端使用的模块副本')
+    parser.add_argument('--check', action='store_true', help='只检查副本是否一致')
+    args = parser.parse_args()
+
+    if args.check:
+        stale = stale_copies()
+        for name in stale:
+            print(f"2计算技术指标/{name} 与 1获取数据/{name} 不一致，请运行 python sync_copies.py")
+        sys.exit(1 if stale else 0)
+
+    for name in COPIES:
+        with open(os.path.join(COPY_DIR, name), 'w', encoding='utf-8', newline='') as f:
+            f.write(render_copy(name))
+        print(f"已生成 2计算技术指标/{name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+BarRing / KlineSeriesStore 与原来基于 pandas 的合并（merge_bars）逐根比对
+运行: python -m pytest test_bar_ring.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from bar_cache import KlineSeriesStore
+from bar_ring import BarRing, frame_to_arrays
+
+COLUMNS = ['DateTime', 'Close', 'High', 'Low', 'Open', 'Volume']
+
+
+def merge_bars(series: pd.DataFrame, bars: pd.DataFrame, max_bars: int) -> pd.DataFrame:
+    """原 bar_cache.merge_bars：同一时间的K线被替换，更新的时间追加在末尾，只保留最近 max_bars 根"""
+    if series is None or series.empty:
+        merged = bars
+    else:
+        merged = pd.concat([series[~series['DateTime'].isin(bars['DateTime'])], bars])
+        merged = merged.sort_values(by='DateTime', ascending=True)
+    return merged.iloc[-max_bars:].reset_index(drop=True)
+
+
+def random_bars(rng: np.random.Generator, minutes: np.ndarray) -> pd.DataFrame:
+    close = rng.normal(10, 1, len(minutes)).round(3)
+    return pd.DataFrame({
+        'DateTime': pd.Timestamp('2025-09-22 09:30') + pd.to_timedelta(minutes, unit='min'),
+        'Close': close,
+        'High': close + 0.01,
+        'Low': close - 0.01,
+        'Open': close,
+        'Volume': rng.integers(0, 10000, len(minutes)),
+    })[COLUMNS]
+
+
+def assert_same(got: pd.DataFrame, expected: pd.DataFrame):
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_ring_matches_merge_bars():
+    """2000 次随机的尾部抓取、推送（替换未收盘、追加、改写更早的K线）与 merge_bars 结果一致"""
+    rng = np.random.default_rng(0)
+    capacity = 50
+    for _ in range(20):
+        start = int(rng.integers(1, 80))
+        expected = random_bars(rng, np.arange(start))
+        ring = BarRing(capacity)
+        ring.append(frame_to_arrays(expected.iloc[-capacity:]))
+        expected = expected.iloc[-capacity:].reset_index(drop=True)
+        last = start - 1
+        for _ in range(100):
+            kind = rng.integers(0, 3)
+            if kind == 0:
+                # 尾部抓取：最近几根，可能带出新K线
+                last += int(rng.integers(0, 3))
+                minutes = np.arange(max(0, last - int(rng.integers(0, 5))), last + 1)
+            elif kind == 1:
+                # 推送：未收盘的最后一根
+                minutes = np.array([last])
+            else:
+                # 更早的K线被改写或补上缺的K线（走合并重建）
+                minutes = np.unique(rng.integers(max(0, last - 2 * capacity), last + 1, int(rng.integers(1, 4))))
+            bars = random_bars(rng, minutes)
+            ring.upsert(frame_to_arrays(bars))
+            expected = merge_bars(expected, bars, capacity)
+            assert_same(ring.to_frame(), expected)
+
+
+def test_store_window_and_since():
+    store = KlineSeriesStore()
+    rng = np.random.default_rng(1)
+    bars = random_bars(rng, np.arange(30))
+    store.seed('K_1M', 'X', bars, 20)
+
+    digest, frame = store.window('K_1M', 'X', 5)
+    assert_same(frame, bars.iloc[-5:])
+    # 内容没变时不组装数据框
+    assert store.window('K_1M', 'X', 5, digest) == (digest, None)
+
+    since = bars['DateTime'].iloc[-3]
+    assert_same(store.get('K_1M', 'X', since=since), bars.iloc[-3:])
+    assert_same(store.get('K_1M', 'X'), bars.iloc[-20:])
+
+    store.apply('K_1M', 'X', random_bars(rng, np.array([29])), 20)
+    assert store.window('K_1M', 'X', 5, digest)[1] is not None
+    assert store.get('K_1M', 'Y') is None
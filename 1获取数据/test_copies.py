@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+2计算技术指标/ 下的模块副本与本目录的原文件一致（见 sync_copies.py）
+运行: python -m pytest test_copies.py
+"""
+
+from sync_copies import stale_copies
+
+
+def test_copies_up_to_date():
+    assert stale_copies() == [], "副本已过期，请运行 python sync_copies.py"
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+逐笔/报价推送驱动的未收盘 1 分钟K线
+订阅 QUOTE（报价）或 TICKER（逐笔）推送，每次推送把成交价、成交量合并进当前分钟的K线，
+未收盘K线不必等到轮询或 CurKline 推送才更新；已收盘K线仍以 OpenD 的K线为准（之后的推送、轮询会整根替换）
+get_market_snapshot 快照也按同样的方式转为成交，一次请求更新几百个代码的最后一根K线
+
+成交量：TICKER 为每笔的成交量；QUOTE 推送和快照是当日累计成交量，取与上一次的差值，每个代码的第一次报价只更新价格
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+try:
+    from moomoo import StockQuoteHandlerBase, TickerHandlerBase
+except ImportError:
+    from futu import StockQuoteHandlerBase, TickerHandlerBase
+
+from bar_codec import BAR_COLUMNS
+from bar_resample import hour_labels
+from kline_push import PushCallbackMixin
+from trading_calendar import CALENDARS, DEFAULT_MARKETS, minute_of_day
+
+# 支持的推送类型（同时也是订阅类型）
+TICK_TYPES = ('QUOTE', 'TICKER')
+
+
+def minute_labels(times: pd.Series, market: str = DEFAULT_MARKETS[0]) -> pd.Series:
+    """
+    每笔成交所属 1 分钟K线的时间
+
+    1 分钟K线的时间为该分钟的结束时间（与 get_cur_kline 一致），按市场的交易时段（trading_calendar.CALENDARS）归并：
+    开盘之前的集合竞价并入开盘那一根（09:30），时段之间（午休）并入前一时段的收盘，
+    收盘之后的收盘集合竞价并入收盘（港股半日市 12:00 之后的收盘竞价落在午休里，同样并入 12:00）
+
+    Args:
+        times: 成交时间
+        market: 代码所在市场
+
+    Returns:
+        pandas.Series: K线时间
+    """
+    sessions = CALENDARS[market].sessions
+    open_bar = minute_of_day(sessions[0][0])
+    day_close = minute_of_day(sessions[-1][1])
+    # 时段之间的休市：(前一时段收盘, 后一时段开盘)
+    breaks = [(minute_of_day(end), minute_of_day(start)) for (_, end), (start, _) in zip(sessions, sessions[1:])]
+
+    floor = times.dt.floor('min')
+    minutes = (floor.dt.hour * 60 + floor.dt.minute).to_numpy() + 1
+    minutes = np.select([minutes <= open_bar, minutes > day_close] +
+                        [(minutes > close) & (minutes <= reopen) for close, reopen in breaks],
+                        [open_bar, day_close] + [close for close, _ in breaks], minutes)
+    return floor.dt.normalize() + pd.to_timedelta(minutes, unit='min')
+
+
+def ticks_from_ticker(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    TICKER 推送转为成交列表
+
+    Returns:
+        pandas.DataFrame: 列 code、DateTime、Price、Volume
+    """
+    return pd.DataFrame({
+        'code': data['code'].to_numpy(),
+        'DateTime': pd.to_datetime(data['time']).to_numpy(),
+        'Price': data['price'].to_numpy(dtype='float64'),
+        'Volume': data['volume'].to_numpy(dtype='int64'),
+    })
+
+
+def _cumulative_ticks(codes: pd.Series, times: pd.Series, prices: pd.Series, totals: pd.Series,
+                      last_volume: Dict[str, int]) -> pd.DataFrame:
+    """由当日累计成交量得到成交列表，成交量为与上一次的累计成交量之差，last_volume 会被更新"""
+    volumes = []
+    for code, total in zip(codes, totals.to_numpy(dtype='int64')):
+        previous = last_volume.get(code)
+        # 第一次报价或跨日（累计成交量变小）时没有基准
+        volumes.append(0 if previous is None or total < previous else total - previous)
+        last_volume[code] = total
+    return pd.DataFrame({
+        'code': codes.to_numpy(),
+        'DateTime': pd.to_datetime(times).to_numpy(),
+        'Price': prices.to_numpy(dtype='float64'),
+        'Volume': np.asarray(volumes, dtype='int64'),
+    })
+
+
+def ticks_from_quote(data: pd.DataFrame, last_volume: Dict[str, int]) -> pd.DataFrame:
+    """
+    QUOTE 推送转为成交列表，成交量为与上一次报价的累计成交量之差
+
+    Args:
+        data: 报价推送
+        last_volume: 代码 -> 上一次报价的累计成交量，会被更新
+
+    Returns:
+        pandas.DataFrame: 列 code、DateTime、Price、Volume
+    """
+    return _cumulative_ticks(data['code'], data['data_date'] + ' ' + data['data_time'],
+                             data['last_price'], data['volume'], last_volume)
+
+
+def ticks_from_snapshot(data: pd.DataFrame, last_volume: Dict[str, int]) -> pd.DataFrame:
+    """
+    get_market_snapshot 快照转为成交列表（每个代码一笔，时间为最近一次成交的时间）
+
+    Args:
+        data: 快照
+        last_volume: 代码 -> 上一次的累计成交量，会被更新（与 QUOTE 推送共用）
+
+    Returns:
+        pandas.DataFrame: 列 code、DateTime、Price、Volume
+    """
+    return _cumulative_ticks(data['code'], data['update_time'], data['last_price'], data['volume'], last_volume)
+
+
+def day_bars_from_snapshot(data: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    快照中当日的开高低收和成交量就是当天的日K，直接整根替换
+
+    Returns:
+        Dict: 代码 -> 当天的日K（一根）；当天还没有成交的代码不包含在内
+    """
+    data = data[data['volume'] > 0]
+    bars = pd.DataFrame({
+        'DateTime': pd.to_datetime(data['update_time']).dt.normalize().to_numpy(),
+        'Close': data['last_price'].to_numpy(dtype='float64'),
+        'High': data['high_price'].to_numpy(dtype='float64'),
+        'Low': data['low_price'].to_numpy(dtype='float64'),
+        'Open': data['open_price'].to_numpy(dtype='float64'),
+        'Volume': data['volume'].to_numpy(dtype='int64'),
+    })
+    return {code: bars.iloc[[i]].reset_index(drop=True) for i, code in enumerate(data['code'])}
+
+
+def aggregate_ticks(ticks: pd.DataFrame, ktype: str = 'K_1M') -> Dict[str, pd.DataFrame]:
+    """
+    把一次推送的成交按代码、K线时间合并成K线
+
+    Args:
+        ticks: 成交列表（按到达顺序）
+        ktype: 'K_1M' 或 'K_60M'（以结束时间为K线时间的周期）
+
+    Returns:
+        Dict: 代码 -> 这些成交合成的K线（按时间升序）
+    """
+    if ticks.empty:
+        return {}
+    if ktype not in ('K_1M', 'K_60M'):
+        raise ValueError(f"不支持由成交合成的K线类型: {ktype}")
+    # 各市场按自己的交易时段划分
+    markets = ticks['code'].str.split('.', n=1).str[0]
+    labels = pd.Series(pd.NaT, index=ticks.index, dtype='datetime64[ns]')
+    for market, times in ticks['DateTime'].groupby(markets):
+        market_labels = minute_labels(times, market)
+        if ktype == 'K_60M':
+            market_labels = hour_labels(market_labels, market)
+        labels[times.index] = market_labels
+    ticks = ticks.assign(DateTime=labels)
+    bars = ticks.groupby(['code', 'DateTime'], sort=True).agg(
+        Close=('Price', 'last'),
+        High=('Price', 'max'),
+        Low=('Price', 'min'),
+        Open=('Price', 'first'),
+        Volume=('Volume', 'sum'),
+    ).reset_index()
+    return {code: group[BAR_COLUMNS].reset_index(drop=True) for code, group in bars.groupby('code', sort=False)}
+
+
+class QuotePushHandler(PushCallbackMixin, StockQuoteHandlerBase):
+    """QUOTE 报价推送回调"""
+
+    push_name = '报价推送'
+
+
+class TickerPushHandler(PushCallbackMixin, TickerHandlerBase):
+    """TICKER 逐笔推送回调"""
+
+    push_name = '逐笔推送'
+
+
+# 推送类型 -> 处理器
+TICK_HANDLERS = {'QUOTE': QuotePushHandler, 'TICKER': TickerPushHandler}
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+交易日历与K线收盘时间（按市场）
+A股（SH、SZ）：交易时段 09:30-11:30、13:00-15:00，周末和 fetch_config.HOLIDAYS 中的日期休市
+港股（HK）：   交易时段 09:30-12:00、13:00-16:00，周末和 fetch_config.HK_HOLIDAYS 中的日期休市，
+              fetch_config.HK_HALF_DAYS 中的日期只有上午时段
+抓取服务据此在每个周期的K线收盘后刷新，休市时段空闲等待；同时抓取多个市场时，
+任一市场的K线收盘都触发刷新，任一市场在交易时段内即不算休市（见 last_boundary、next_boundary、in_session）
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+import fetch_config
+
+# 往前、往后查找交易日的最大天数（覆盖最长的长假）
+MAX_SEARCH_DAYS = 20
+
+
+class MarketCalendar:
+    """一个市场的交易时段、60 分钟K线收盘时间和休市日"""
+
+    def __init__(self, sessions: List[Tuple[time, time]], hour_bar_ends: List[time],
+                 holidays: Iterable[str], half_days: Iterable[str] = ()):
+        """
+        Args:
+            sessions: 交易时段 [(开始, 结束), ...]，按时间升序
+            hour_bar_ends: 60 分钟K线的收盘时间
+            holidays: 周末以外的休市日 'YYYY-MM-DD'
+            half_days: 只有第一个交易时段的半日市 'YYYY-MM-DD'
+        """
+        self.sessions = sessions
+        self.hour_bar_ends = hour_bar_ends
+        self.holidays = frozenset(date.fromisoformat(d) for d in holidays)
+        self.half_days = frozenset(date.fromisoformat(d) for d in half_days)
+
+    def sessions_on(self, day: date) -> List[Tuple[time, time]]:
+        """某交易日的交易时段（半日市只有第一个时段）"""
+        return self.sessions[:1] if day in self.half_days else self.sessions
+
+    def is_trading_day(self, day: date) -> bool:
+        """是否为交易日"""
+        return day.weekday() < 5 and day not in self.holidays
+
+    def next_trading_day(self, day: date) -> date:
+        """下一个交易日（不含当天）"""
+        for _ in range(MAX_SEARCH_DAYS):
+            day += timedelta(days=1)
+            if self.is_trading_day(day):
+                return day
+        raise ValueError(f"{day} 之后 {MAX_SEARCH_DAYS} 天内没有交易日，请检查休市日配置")
+
+    def is_last_trading_day_of_week(self, day: date) -> bool:
+        """是否为本周最后一个交易日"""
+        nxt = self.next_trading_day(day)
+        return nxt.isocalendar()[:2] != day.isocalendar()[:2]
+
+    def in_session(self, now: datetime) -> bool:
+        """当前是否在交易时段内"""
+        if not self.is_trading_day(now.date()):
+            return False
+        t = now.time()
+        return any(start <= t <= end for start, end in self.sessions_on(now.date()))
+
+    def bar_boundaries(self, tf_name: str, day: date) -> List[datetime]:
+        """
+        某交易日内一个周期的全部K线收盘时间
+
+        Args:
+            tf_name: 周期名称 '1K'、'1H'、'1D'、'1W'
+            day: 日期
+
+        Returns:
+            List[datetime]: 收盘时间，按时间升序；非交易日返回空列表
+        """
+        if not self.is_trading_day(day):
+            return []
+
+        sessions = self.sessions_on(day)
+        close = sessions[-1][1]
+        if tf_name == '1K':
+            # 开盘集合竞价一根，之后每分钟一根
+            times = [datetime.combine(day, sessions[0][0])]
+            for start, end in sessions:
+                t = datetime.combine(day, start) + timedelta(minutes=1)
+                while t <= datetime.combine(day, end):
+                    times.append(t)
+                    t += timedelta(minutes=1)
+            return times
+        if tf_name == '1H':
+            return [datetime.combine(day, t) for t in self.hour_bar_ends if t <= close]
+        if tf_name == '1D':
+            return [datetime.combine(day, close)]
+        if tf_name == '1W':
+            return [datetime.combine(day, close)] if self.is_last_trading_day_of_week(day) else []
+        raise ValueError(f"未知的周期: {tf_name}")
+
+    def last_boundary(self, tf_name: str, now: datetime) -> Optional[datetime]:
+        """不晚于 now 的最近一次K线收盘时间，找不到时返回 None"""
+        day = now.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            past = [t for t in self.bar_boundaries(tf_name, day) if t <= now]
+            if past:
+                return past[-1]
+            day -= timedelta(days=1)
+        return None
+
+    def next_boundary(self, tf_name: str, now: datetime) -> datetime:
+        """晚于 now 的下一次K线收盘时间"""
+        day = now.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            future = [t for t in self.bar_boundaries(tf_name, day) if t > now]
+            if future:
+                return future[0]
+            day += timedelta(days=1)
+        raise ValueError(f"{now} 之后 {MAX_SEARCH_DAYS} 天内没有 {tf_name} 收盘时间，请检查休市日配置")
+
+
+A_SHARE = MarketCalendar(
+    sessions=[(time(9, 30), time(11, 30)), (time(13, 0), time(15, 0))],
+    hour_bar_ends=[time(10, 30), time(11, 30), time(14, 0), time(15, 0)],
+    holidays=fetch_config.HOLIDAYS)
+
+# 港股上午时段两个半小时，12:00 为半小时的一根60 分钟K线；收盘竞价（16:00-16:10）的成交并入 16:00 那一根
+HONG_KONG = MarketCalendar(
+    sessions=[(time(9, 30), time(12, 0)), (time(13, 0), time(16, 0))],
+    hour_bar_ends=[time(10, 30), time(11, 30), time(12, 0), time(14, 0), time(15, 0), time(16, 0)],
+    holidays=fetch_config.HK_HOLIDAYS,
+    half_days=fetch_config.HK_HALF_DAYS)
+
+# 市场代码 -> 交易日历；不在这里的市场（如 US）没有交易日历，不能启用（见 universe.CALENDAR_MARKETS）
+CALENDARS = {'SH': A_SHARE, 'SZ': A_SHARE, 'HK': HONG_KONG}
+
+# 没有指定市场时使用A股日历
+DEFAULT_MARKETS = ('SH',)
+
+
+def market_of(code: str) -> str:
+    """futu 格式代码的市场，如 'HK.00700' -> 'HK'"""
+    return code.split('.', 1)[0]
+
+
+def _calendars(markets: Iterable[str]) -> List[MarketCalendar]:
+    """若干市场的交易日历（同一个日历只出现一次）"""
+    return list({id(CALENDARS[m]): CALENDARS[m] for m in markets}.values())
+
+
+def minute_of_day(t: time) -> int:
+    """时间对应的当天分钟数"""
+    return t.hour * 60 + t.minute
+
+
+def session_open(markets: Iterable[str] = DEFAULT_MARKETS) -> time:
+    """这些市场中最早的开盘时间"""
+    return min(cal.sessions[0][0] for cal in _calendars(markets))
+
+
+def is_trading_day(day: date, markets: Iterable[str] = DEFAULT_MARKETS) -> bool:
+    """是否为其中任一市场的交易日"""
+    return any(cal.is_trading_day(day) for cal in _calendars(markets))
+
+
+def in_session(now: datetime, markets: Iterable[str] = DEFAULT_MARKETS) -> bool:
+    """当前是否在其中任一市场的交易时段内"""
+    return any(cal.in_session(now) for cal in _calendars(markets))
+
+
+def bar_boundaries(tf_name: str, day: date, markets: Iterable[str] = DEFAULT_MARKETS) -> List[datetime]:
+    """某日内这些市场一个周期的全部K线收盘时间（合并去重，按时间升序）"""
+    return sorted({t for cal in _calendars(markets) for t in cal.bar_boundaries(tf_name, day)})
+
+
+def last_boundary(tf_name: str, now: datetime, markets: Iterable[str] = DEFAULT_MARKETS) -> Optional[datetime]:
+    """不晚于 now 的最近一次任一市场的K线收盘时间，找不到时返回 None"""
+    past = [t for t in (cal.last_boundary(tf_name, now) for cal in _calendars(markets)) if t is not None]
+    return max(past) if past else None
+
+
+def next_boundary(tf_name: str, now: datetime, markets: Iterable[str] = DEFAULT_MARKETS) -> datetime:
+    """晚于 now 的下一次任一市场的K线收盘时间"""
+    return min(cal.next_boundary(tf_name, now) for cal in _calendars(markets))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+代码池注册表
+所有代码池（ETF88、恒生指数、恒生科技……）集中在 fetch_config.UNIVERSES 定义，代码在这里统一转为 futu 格式，
+每个代码池有成员版本号，成员变化时版本加一，抓取服务据此只增减有变化的订阅（见 subscription）
+
+可选的 fetch_config.UNIVERSE_FILE（JSON）可以在不重启服务的情况下修改代码池：
+    {"active": ["ETF88", "HSTECH"], "universes": {"HSTECH": ["HK.00700", ...]}}
+文件里的代码池覆盖同名的配置，active 覆盖 fetch_config.ACTIVE_UNIVERSES
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import fetch_config
+from trading_calendar import CALENDARS
+
+logger = logging.getLogger(__name__)
+
+# 可以识别的市场代码
+MARKETS = ('SH', 'SZ', 'HK', 'US')
+
+# 可以启用的市场：有交易日历（trading_calendar.CALENDARS）的市场，
+# 其它市场（如 US）的代码池可以定义，但没有收盘时间、午休、休市日，不允许启用
+CALENDAR_MARKETS = tuple(CALENDARS)
+
+
+def normalize_code(code: str) -> str:
+    """
+    统一为 futu/moomoo 格式：'512480.SH'、'sh512480'、'SH.512480' -> 'SH.512480'
+
+    Args:
+        code: 通达信格式、futu 格式或带小写市场前缀的代码
+
+    Returns:
+        str: futu/moomoo 格式代码
+    """
+    code = code.strip().upper()
+    if '.' in code:
+        left, right = code.split('.', 1)
+        if left in MARKETS:
+            return f"{left}.{right}"
+        if right in MARKETS:
+            return f"{right}.{left}"
+    elif code[:2] in MARKETS:
+        return f"{code[:2]}.{code[2:]}"
+    raise ValueError(f"无法识别的代码格式: {code}")
+
+
+class UniverseRegistry:
+    """命名代码池及其成员版本"""
+
+    def __init__(self, universes: Dict[str, List[str]], active: List[str], path: Optional[str] = None):
+        """
+        Args:
+            universes: 代码池名称 -> 代码列表（任意可识别格式）
+            active: 抓取服务使用的代码池名称
+            path: 可选的 JSON 文件，reload 时读取
+        """
+        self.path = path
+        self.base = universes
+        self.members: Dict[str, List[str]] = {}
+        self.versions: Dict[str, int] = {}
+        self.active: List[str] = []
+        self.lock = threading.Lock()
+
+        self._apply(universes, active)
+        self.mtime = None
+        self.reload()
+
+    @classmethod
+    def from_config(cls) -> 'UniverseRegistry':
+        """按 fetch_config 创建注册表"""
+        return cls(fetch_config.UNIVERSES, fetch_config.ACTIVE_UNIVERSES, fetch_config.UNIVERSE_FILE)
+
+    def define(self, name: str, codes: Iterable[str]) -> bool:
+        """
+        定义或修改一个代码池（代码去重、保持顺序）
+
+        Returns:
+            bool: 成员是否有变化
+        """
+        normalized = list(dict.fromkeys(normalize_code(code) for code in codes))
+        with self.lock:
+            if self.members.get(name) == normalized:
+                return False
+            self.members[name] = normalized
+            self.versions[name] = self.versions.get(name, 0) + 1
+        logger.info(f"代码池 {name}: {len(normalized)} 个代码，版本 {self.versions[name]}")
+        return True
+
+    def _apply(self, universes: Dict[str, List[str]], active: List[str]) -> bool:
+        """
+        合并一组代码池定义和启用列表，返回是否有变化
+
+        先检查合并后的定义，有错误时抛出 ValueError，当前的定义和启用列表都不变
+        """
+        normalized = {name: [normalize_code(code) for code in codes] for name, codes in universes.items()}
+        with self.lock:
+            members = {**self.members, **normalized}
+        unknown = [name for name in active if name not in members]
+        if unknown:
+            raise ValueError(f"未定义的代码池: {unknown}")
+        unsupported = {name: code for name in active for code in members[name]
+                       if code.split('.', 1)[0] not in CALENDAR_MARKETS}
+        if unsupported:
+            raise ValueError(f"代码池 {list(unsupported)} 含交易日历不支持的市场（如 {list(unsupported.values())}），"
+                             f"目前只能启用 {CALENDAR_MARKETS} 的代码池")
+
+        changed = False
+        for name, codes in normalized.items():
+            changed |= self.define(name, codes)
+        if list(active) != self.active:
+            self.active = list(active)
+            changed = True
+        return changed
+
+    def reload(self) -> bool:
+        """
+        文件修改过时重新读取（读取失败时保留当前定义）
+
+        Returns:
+            bool: 代码池或启用列表是否有变化
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                config = json.load(f)
+            universes = dict(self.base)
+            universes.update(config.get('universes', {}))
+            return self._apply(universes, config.get('active', self.active))
+        except Exception as e:
+            logger.error(f"读取代码池文件 {self.path} 失败: {e}")
+            return False
+
+    def codes(self, names: Optional[List[str]] = None) -> List[str]:
+        """
+        若干代码池的并集（去重，按代码池顺序）
+
+        Args:
+            names: 代码池名称，默认为启用的代码池
+
+        Returns:
+            List[str]: futu 格式代码列表
+        """
+        with self.lock:
+            names = self.active if names is None else names
+            return list(dict.fromkeys(code for name in names for code in self.members[name]))
+
+    def active_members(self) -> Dict[str, List[str]]:
+        """
+        启用的代码池各自的成员
+
+        Returns:
+            Dict: 代码池名称 -> futu 格式代码列表（按启用顺序）
+        """
+        with self.lock:
+            return {name: list(self.members[name]) for name in self.active}
+
+    def version(self, name: str) -> int:
+        """代码池的成员版本"""
+        return self.versions.get(name, 0)
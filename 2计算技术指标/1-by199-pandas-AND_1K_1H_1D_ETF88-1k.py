@@ -7,13 +7,14 @@ Redis地址池方式读取数据脚本
 
 import redis
 import pandas as pd
-import io
 import logging
 import time
 import paho.mqtt.client as mqtt
 from typing import Optional, List
 from redis.connection import ConnectionPool
 
+from bar_codec import decode_frame
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -46,7 +47,7 @@ class RedisDataReader:
             db=db,
             password=password,
             max_connections=max_connections,
-            decode_responses=True,  # 自动解码响应为字符串
+            decode_responses=False,  # 值可能是二进制格式，由 bar_codec 解码
             socket_connect_timeout=5,  # 连接超时
             socket_timeout=5,  # 读取超时
             retry_on_timeout=True,  # 超时重试
@@ -61,7 +62,7 @@ class RedisDataReader:
     
     def read_from_redis(self, data_key: str) -> pd.DataFrame:
         """
-        从Redis读取CSV格式的数据
+        从Redis读取数据，自动识别 CSV 和 bar_codec 二进制格式
         
         Args:
             data_key: Redis键名
@@ -78,10 +79,10 @@ class RedisDataReader:
                 return pd.DataFrame()
             
             # 获取数据
-            csv_data = redis_client.get(data_key)
+            payload = redis_client.get(data_key)
             
             # 调试信息：检查Redis中是否有数据
-            if csv_data is None:
+            if payload is None:
                 logger.warning(f"Redis键 '{data_key}' 中没有数据或值为空 (服务器: {self.host}:{self.port})")
                 # 检查Redis中所有的键
                 try:
@@ -91,11 +92,11 @@ class RedisDataReader:
                     logger.error(f"无法获取Redis键列表: {e}")
                 return pd.DataFrame()
             
-            logger.info(f"从Redis键 '{data_key}' 成功读取数据，数据长度: {len(csv_data)} (服务器: {self.host}:{self.port})")
+            logger.info(f"从Redis键 '{data_key}' 成功读取数据，数据长度: {len(payload)} (服务器: {self.host}:{self.port})")
             
-            # 解析CSV数据
-            df = pd.read_csv(io.StringIO(csv_data))
-            logger.info(f"成功解析CSV数据，行数: {len(df)}，列数: {len(df.columns)}")
+            # 解析数据（CSV 或二进制）
+            df = decode_frame(payload)
+            logger.info(f"成功解析数据，行数: {len(df)}，列数: {len(df.columns)}")
             
             return df
             
@@ -121,7 +122,7 @@ class RedisDataReader:
         """
         try:
             redis_client = self.get_redis_client()
-            keys = redis_client.keys(pattern)
+            keys = [key.decode('utf-8') for key in redis_client.keys(pattern)]
             logger.info(f"找到 {len(keys)} 个匹配的键: {keys}")
             return keys
         except Exception as e:
@@ -165,7 +166,7 @@ def get_data_redis_client() -> redis.Redis:
         host='192.168.102.199',
         port=6379,
         db=0,
-        decode_responses=True,
+        decode_responses=False,
         max_connections=10
     )
     return redis.Redis(connection_pool=pool)
@@ -173,7 +174,7 @@ def get_data_redis_client() -> redis.Redis:
 
 def read_from_redis(data_key: str) -> pd.DataFrame:
     """
-    从Redis读取CSV格式的数据 (从192.168.102.199)
+    从Redis读取数据 (从192.168.102.199)，自动识别 CSV 和 bar_codec 二进制格式
     
     Args:
         data_key: Redis键名
@@ -183,10 +184,10 @@ def read_from_redis(data_key: str) -> pd.DataFrame:
     """
     try:
         redis_client = get_data_redis_client()
-        csv_data = redis_client.get(data_key)
+        payload = redis_client.get(data_key)
         
         # 调试信息：检查Redis中是否有数据
-        if csv_data is None:
+        if payload is None:
             print(f"Redis键 '{data_key}' 中没有数据或值为空 (服务器: 192.168.102.199)")
             # 检查Redis中所有的键
             try:
@@ -196,10 +197,10 @@ def read_from_redis(data_key: str) -> pd.DataFrame:
                 print("无法获取Redis键列表")
             return pd.DataFrame()
         
-        print(f"从Redis键 '{data_key}' 成功读取数据，数据长度: {len(csv_data)} (服务器: 192.168.102.199)")
+        print(f"从Redis键 '{data_key}' 成功读取数据，数据长度: {len(payload)} (服务器: 192.168.102.199)")
         
-        df = pd.read_csv(io.StringIO(csv_data))
-        print(f"成功解析CSV数据，行数: {len(df)}，列数: {len(df.columns)}")
+        df = decode_frame(payload)
+        print(f"成功解析数据，行数: {len(df)}，列数: {len(df.columns)}")
         return df
     except Exception as e:
         print(f"从Redis读取数据失败：{e}")
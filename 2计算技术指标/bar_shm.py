@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+同机共享内存K线交换
+抓取服务把每个代码每个周期的K线数组写进一个命名共享内存段，同一台机器上的计算进程直接映射读取，
+不经过 CSV 序列化和 Redis 网络往返；跨机器仍然走 Redis
+
+段名为 Redis 键名把 '.' 换成 '_'，如 BY54_1K_SH_512480now_py1（见 shm_name）
+段布局：头部 + 按列连续存放的数组（每列 capacity 个元素）
+    头部：魔数(4) + 版本(2) + 列数(2) + 容量(8) + 序号(8) + 根数(8)
+    列：  DateTime int64 纳秒、Close/High/Low/Open float64、Volume int64，前 根数 个元素有效
+序号是顺序锁：写入前加一（奇数表示正在写），写完再加一；读取端读前读后序号相同且为偶数才算读到完整的数据
+（CPython 在 x86/x64 上的写入顺序与代码顺序一致）
+
+本文件由 1获取数据/sync_copies.py 从 1获取数据/bar_shm.py 生成，不要直接修改
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bar_codec import BAR_VALUE_DTYPES
+
+if os.name == 'posix':
+    from multiprocessing import resource_tracker
+else:
+    # Windows 上共享内存不经过 resource_tracker，没有进程打开时由系统回收
+    resource_tracker = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BYSH'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQQ')
+SEQ_OFFSET = 16
+COUNT_OFFSET = 24
+
+# 列及其类型（bar_codec.BAR_COLUMNS 的顺序）
+COLUMNS = [('DateTime', np.int64)] + list(BAR_VALUE_DTYPES.items())
+
+
+def shm_name(key_name: str) -> str:
+    """Redis 键名对应的共享内存段名"""
+    return key_name.replace('.', '_')
+
+
+def _open(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """
+    打开或创建段，不让本进程的 resource_tracker 在退出时删除它：段跨进程重启保留，
+    抓取服务重启后继续写同一个段，读取端的映射一直有效
+    （Python 3.13 起有 track 参数，之前的版本只能打开后取消登记）
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        if resource_tracker is not None:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    """删除段（旧版本的 unlink 会向 resource_tracker 取消登记，先补登记）"""
+    if resource_tracker is not None and 'track' not in shared_memory.SharedMemory.__init__.__code__.co_varnames:
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+
+class _Segment:
+    """一个共享内存段上的头部字段和列数组视图"""
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        magic, version, ncols, capacity, _, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION or ncols != len(COLUMNS):
+            raise ValueError(f"共享内存段 {shm.name} 格式不符")
+        self.capacity = capacity
+        self.seq = np.ndarray((1,), dtype='<u8', buffer=shm.buf, offset=SEQ_OFFSET)
+        self.count = np.ndarray((1,), dtype='<u8', buffer=shm.buf, offset=COUNT_OFFSET)
+        self.columns: Dict[str, np.ndarray] = {}
+        offset = HEADER.size
+        for name, dtype in COLUMNS:
+            self.columns[name] = np.ndarray((capacity,), dtype=dtype, buffer=shm.buf, offset=offset)
+            offset += capacity * np.dtype(dtype).itemsize
+
+    @staticmethod
+    def size(capacity: int) -> int:
+        return HEADER.size + capacity * sum(np.dtype(dtype).itemsize for _, dtype in COLUMNS)
+
+    def release(self):
+        # 视图引用着 shm.buf，关闭前先释放
+        self.seq = self.count = None
+        self.columns = {}
+        self.shm.close()
+
+
+class ShmBarWriter:
+    """抓取端：创建并更新共享内存段（推送线程、成交写入线程和主循环共用，打开和写入都在锁内）"""
+
+    def __init__(self):
+        self.segments: Dict[str, _Segment] = {}
+        # 两个线程同时写一个段会让序号的奇偶失去意义（读取端接受写了一半的数据），同时创建一个段会 FileExistsError
+        self._lock = threading.Lock()
+
+    def _open(self, name: str, capacity: int) -> _Segment:
+        """打开上次运行留下的同容量段继续使用，没有或格式不符时重新创建"""
+        try:
+            seg = _Segment(_open(name))
+            if seg.capacity == capacity:
+                # 上次可能在写入中途退出，序号停在奇数
+                if seg.seq[0] % 2:
+                    seg.seq[0] += 1
+                return seg
+            shm = seg.shm
+            seg.release()
+            _unlink(shm)
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error):
+            old = _open(name)
+            old.close()
+            _unlink(old)
+        logger.info(f"创建共享内存段 {name}，容量 {capacity}")
+
+        shm = _open(name, create=True, size=_Segment.size(capacity))
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, len(COLUMNS), capacity, 0, 0)
+        return _Segment(shm)
+
+    def publish(self, name: str, arrays: Dict[str, np.ndarray], capacity: int):
+        """
+        写入一个代码的K线（只保留最近 capacity 根）
+
+        Args:
+            name: 段名（见 shm_name）
+            arrays: 按列的数组，DateTime 为 int64 纳秒
+            capacity: 段的容量，段第一次创建时使用
+        """
+        with self._lock:
+            seg = self.segments.get(name)
+            if seg is None:
+                seg = self.segments[name] = self._open(name, capacity)
+
+            n = min(len(arrays['DateTime']), seg.capacity)
+            seg.seq[0] += 1
+            for col, _ in COLUMNS:
+                seg.columns[col][:n] = arrays[col][len(arrays[col]) - n:]
+            seg.count[0] = n
+            seg.seq[0] += 1
+
+    def close(self):
+        """关闭全部映射；段保留，下次启动继续使用（Windows 上没有进程打开时段会被系统回收）"""
+        with self._lock:
+            for seg in self.segments.values():
+                seg.release()
+            self.segments = {}
+
+    def unlink_all(self):
+        """删除本进程写过的全部段（停用共享内存时）"""
+        with self._lock:
+            names = list(self.segments)
+        self.close()
+        for name in names:
+            try:
+                shm = _open(name)
+                shm.close()
+                _unlink(shm)
+            except FileNotFoundError:
+                pass
+
+
+class ShmBarReader:
+    """计算端：映射共享内存段读取K线"""
+
+    def __init__(self):
+        self.segments: Dict[str, _Segment] = {}
+
+    def _segment(self, name: str) -> Optional[_Segment]:
+        seg = self.segments.get(name)
+        if seg is None:
+            try:
+                seg = self.segments[name] = _Segment(_open(name))
+            except FileNotFoundError:
+                return None
+        return seg
+
+    def version(self, name: str) -> Optional[int]:
+        """段的当前序号，序号变了说明有新数据；段不存在时返回 None"""
+        seg = self._segment(name)
+        return None if seg is None else int(seg.seq[0])
+
+    def view(self, name: str) -> Optional[Tuple[int, Dict[str, np.ndarray]]]:
+        """
+        不复制地取出K线数组视图；用完后用 valid 检查期间没有被改写，否则重新读取
+
+        Returns:
+            tuple: (序号, 按列的只读视图)，段不存在时返回 None
+        """
+        seg = self._segment(name)
+        if seg is None:
+            return None
+        while True:
+            seq = int(seg.seq[0])
+            if seq % 2 == 0:
+                break
+            time.sleep(0)
+        n = int(seg.count[0])
+        views = {}
+        for col, arr in seg.columns.items():
+            v = arr[:n]
+            v.flags.writeable = False
+            views[col] = v
+        return seq, views
+
+    def valid(self, name: str, seq: int) -> bool:
+        """view 取到的数据在此期间是否没有被改写"""
+        seg = self._segment(name)
+        return seg is not None and int(seg.seq[0]) == seq
+
+    def read(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        """复制出一份完整一致的K线数组，段不存在时返回 None"""
+        while True:
+            result = self.view(name)
+            if result is None:
+                return None
+            seq, views = result
+            arrays = {col: v.copy() for col, v in views.items()}
+            if self.valid(name, seq):
+                return arrays
+
+    def read_frame(self, name: str) -> pd.DataFrame:
+        """读取为数据框（列与 Redis 中的K线一致），段不存在时返回空数据框"""
+        arrays = self.read(name)
+        if arrays is None:
+            return pd.DataFrame()
+        arrays['DateTime'] = arrays['DateTime'].view('datetime64[ns]')
+        return pd.DataFrame(arrays)
+
+    def close(self):
+        """关闭全部映射（不删除段）"""
+        for seg in self.segments.values():
+            seg.release()
+        self.segments = {}